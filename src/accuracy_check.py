@@ -1,26 +1,66 @@
 import csv
 import re
 import os
+import threading
+import time
 import numpy as np
 import openvino as ov
+import metrics
+import profiling
+import result_store
 
 
-def load_model(core, model_path, device):
+def run_with_timeout(func, timeout, description):
+    # a hung call cannot be interrupted, so it is left running in a daemon thread that never blocks exit
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"{description} did not finish in {timeout} s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def load_model(core, model_path, device, cache=None, timeout=None):
+    # with a timeout (seconds) a compile that does not finish raises TimeoutError
+    if timeout is not None:
+        return run_with_timeout(lambda: load_model(core, model_path, device, cache), timeout, f"Compiling for {device}")
+
     try:
-        return core.compile_model(model_path, device)
+        with profiling.stage("compile", device=device):
+            if cache is not None:
+                return cache.compile_model(core, model_path, device)
+            return core.compile_model(model_path, device)
     except RuntimeError as e:
         print(f"Error loading model from {model_path}: {str(e)}")
         return None
 
 
-def perform_inference(compiled_model, input_data):
+def perform_inference(compiled_model, input_data, infer_request=None, timeout=None):
+    # an infer request can be passed in to reuse it across samples; with a timeout (seconds)
+    # an inference that does not finish is cancelled and raises TimeoutError
     try:
-        infer_request = compiled_model.create_infer_request()
+        if infer_request is None:
+            infer_request = compiled_model.create_infer_request()
         for i, input_tensor in enumerate(input_data):
             infer_request.set_input_tensor(i, input_tensor)
 
-        infer_request.start_async()
-        infer_request.wait()
+        with profiling.stage("infer"):
+            infer_request.start_async()
+            if timeout is None:
+                infer_request.wait()
+            elif not infer_request.wait_for(int(timeout * 1000)):
+                infer_request.cancel()
+                raise TimeoutError(f"Inference did not finish in {timeout} s")
 
         return [infer_request.get_output_tensor(i).data for i in range(len(compiled_model.outputs))]
     except RuntimeError as e:
@@ -29,86 +69,303 @@ def perform_inference(compiled_model, input_data):
 
 
 def compare_results(cpu_results, npu_results, accuracy, use_tol=True):
-    all_passed = True
-    matched_count = 0
-    total_elements = sum(cpu.size for cpu in cpu_results)
+    with profiling.stage("compare"):
+        comparison = metrics.compare_outputs(cpu_results, npu_results, [accuracy] if use_tol else [], [] if use_tol else [accuracy], top_k=0)
+    return (comparison.tol_results() + comparison.dp_results())[0]
 
-    for cpu, npu in zip(cpu_results, npu_results):
-        if use_tol:
-            matches = np.isclose(cpu, npu, atol=accuracy)
-        else:
-            matches = np.round(cpu, accuracy) == np.round(npu, accuracy)
 
-        matched_count += np.sum(matches)
-        if not np.all(matches):
-            all_passed = False
+def compare_result_absolute_error(cpu_results, npu_results):
+    return [format_top_errors(metrics.compare_outputs(cpu_results, npu_results, [], []))]
 
-    match_percentage = int((matched_count / total_elements) * 100)
-    return all_passed, match_percentage
 
+def format_top_errors(comparison):
+    return ','.join(f"{diff:.4f}" for diff in comparison.top_errors())
 
-def compare_result_absolute_error(cpu_results, npu_results):
-    all_diffs = []
-    for cpu, npu in zip(cpu_results, npu_results):
-        abs_diff = np.abs(cpu - npu)
-        all_diffs.extend(abs_diff.flatten())
-    
-    top_5_diffs = sorted(all_diffs, reverse=True)[:5]
-    return [','.join(f"{diff:.4f}" for diff in top_5_diffs)]
+
+def format_worst_elements(comparison):
+    # output index and flat element index of each of the highest errors
+    return ','.join(f"{output}:{index}" for output, index in comparison.worst_elements())
 
 
 def extract_number(filename):
-    match = re.search(r'_(\d+)\.xml$', filename)
+    # also matches replayed rows named "<subgraph>.xml:sample<k>"
+    match = re.search(r'_(\d+)\.xml(:|$)', filename)
     return int(match.group(1)) if match else float('inf')
 
 
 def format_tensor_elements(tensor):
-    return ','.join(f"{x:.4f}" for x in tensor.flatten()[:5])
+    # .flat only reads the first elements, flatten() would copy the whole output
+    return ','.join(f"{x:.4f}" for x in np.asarray(tensor).flat[:5])
 
 
-def accuracy_check(subgraph_file, core, model_path_cpu, model_path_npu, tol, dp):
-    compiled_model_cpu = load_model(core, model_path_cpu, "CPU")
-    compiled_model_npu = load_model(core, model_path_npu, "NPU")
-    if not compiled_model_cpu or not compiled_model_npu:
+def output_bytes(output_info):
+    # size of the output buffers of one infer request, None when a shape is only known after inference
+    if any(output.get_partial_shape().is_dynamic for output in output_info):
+        return None
+    return sum(int(np.prod(output.get_shape())) * output.get_element_type().size for output in output_info)
+
+
+def accuracy_check(subgraph_file, core, model_path_cpu, model_path_npu, tol, dp, cache=None, reference_store=None, target_device="NPU", input_data=None, memory_budget=None):
+    # target_device="CPU" runs the whole pipeline without an NPU, e.g. for benchmarks;
+    # memory_budget (bytes) bounds the CPU and target outputs plus the comparison workspace
+    profiling.set_node(subgraph_file)
+    compiled_model_npu = load_model(core, model_path_npu, target_device, cache)
+    if not compiled_model_npu:
         print(f"Skipping {subgraph_file} due to model loading error.")
         return [subgraph_file] + ["Model loading failed"]
 
-    print(f"Processing {subgraph_file}...")
+    # both output sets are alive while comparing, a check whose outputs alone exceed the budget is not run
+    reserved = output_bytes(compiled_model_npu.outputs) if memory_budget is not None else None
+    if reserved is not None and 2 * reserved + metrics.WORKSPACE_OVERHEAD > memory_budget:
+        print(f"Skipping {subgraph_file}, its outputs need {2 * reserved / 2**20:.1f} MB of the {memory_budget / 2**20:.1f} MB memory budget")
+        return [subgraph_file] + ["Memory budget exceeded"]
 
-    input_info = compiled_model_npu.inputs
-    np.random.seed(911)
-    input_data = [ov.Tensor(array=np.random.rand(*input.shape).astype(input.element_type.to_dtype()), shared_memory=True) for input in input_info]
+    # random inputs unless tensors are given by name, e.g. activations captured for a window
+    if input_data is None:
+        input_data = generate_input_data(compiled_model_npu.inputs)
+    else:
+        input_data = named_input_data(compiled_model_npu.inputs, input_data)
+        if input_data is None:
+            return [subgraph_file] + ["Missing input"]
 
-    cpu_result = perform_inference(compiled_model_cpu, input_data)
-    if cpu_result is None:
-        print(f"Error during CPU inference for {subgraph_file}")
-        return [subgraph_file] + ["Inference failed"]
+    # the CPU reference only depends on the model and the inputs, reuse it when it was stored before
+    reference_key = None
+    if reference_store is not None and isinstance(model_path_cpu, (str, os.PathLike)):
+        reference_key = reference_store.key(model_path_cpu, input_data, "CPU")
+    cpu_result = reference_store.load(reference_key) if reference_key else None
+
+    if cpu_result is not None:
+        print(f"Processing {subgraph_file} with stored CPU reference...")
+    else:
+        compiled_model_cpu = load_model(core, model_path_cpu, "CPU", cache)
+        if not compiled_model_cpu:
+            print(f"Skipping {subgraph_file} due to model loading error.")
+            return [subgraph_file] + ["Model loading failed"]
+
+        print(f"Processing {subgraph_file}...")
+
+        cpu_result = perform_inference(compiled_model_cpu, input_data)
+        if cpu_result is None:
+            print(f"Error during CPU inference for {subgraph_file}")
+            return [subgraph_file] + ["Inference failed"]
+
+        if reference_key:
+            reference_store.save(reference_key, cpu_result, model_path_cpu)
 
     npu_result = perform_inference(compiled_model_npu, input_data)
     if npu_result is None:
         print(f"Error during NPU inference for {subgraph_file}")
         return [subgraph_file] + ["Inference failed"]
-    
+
+    return build_result_row(subgraph_file, cpu_result, npu_result, tol, dp, memory_budget=memory_budget)
+
+
+def triage_check(subgraph_file, core, model_path_cpu, model_path_npu, tol, cache=None, target_device="NPU", compile_timeout=None, infer_timeout=None):
+    """
+    Pass/fail of a model at its tightest tolerance only: the comparison stops at the first
+    failing chunk, and no other metric or tensor is formatted. A compile or inference that
+    exceeds its timeout gives a "timeout" row instead of blocking the sweep.
+
+    Args:
+    subgraph_file (str): The name of the row.
+    core (Core): The OpenVINO core.
+    model_path_cpu (str): The CPU model (path or ov.Model).
+    model_path_npu (str): The target model (path or ov.Model).
+    tol (list): The absolute tolerances, the smallest one is checked.
+    cache (CompiledModelCache): The compiled model cache.
+    target_device (str): The device checked against CPU.
+    compile_timeout (float): The seconds a compile may take, unbounded when None.
+    infer_timeout (float): The seconds an inference may take, unbounded when None.
+
+    Returns:
+    list: The triage row: name, status, first failing element (or the stage that timed out) and seconds.
+    """
+    profiling.set_node(subgraph_file)
+    start = time.perf_counter()
+    stage = f"compile {target_device}"
+    try:
+        compiled_model_npu = load_model(core, model_path_npu, target_device, cache, compile_timeout)
+        stage = "compile CPU"
+        compiled_model_cpu = load_model(core, model_path_cpu, "CPU", cache, compile_timeout) if compiled_model_npu else None
+        if not compiled_model_npu or not compiled_model_cpu:
+            print(f"Skipping {subgraph_file} due to model loading error.")
+            return [subgraph_file] + ["Model loading failed"]
+
+        print(f"Triaging {subgraph_file}...")
+        input_data = generate_input_data(compiled_model_npu.inputs)
+        stage = "infer CPU"
+        cpu_result = perform_inference(compiled_model_cpu, input_data, timeout=infer_timeout)
+        stage = f"infer {target_device}"
+        npu_result = perform_inference(compiled_model_npu, input_data, timeout=infer_timeout) if cpu_result is not None else None
+    except TimeoutError as e:
+        print(f"Timeout for {subgraph_file}: {str(e)}")
+        return [subgraph_file, "timeout", stage, f"{time.perf_counter() - start:.2f}"]
+
+    if cpu_result is None or npu_result is None:
+        print(f"Error during inference for {subgraph_file}")
+        return [subgraph_file] + ["Inference failed"]
+
+    with profiling.stage("compare"):
+        failure = metrics.first_failure(cpu_result, npu_result, min(tol))
+
+    seconds = f"{time.perf_counter() - start:.2f}"
+    if failure is None:
+        return [subgraph_file, "passed", "", seconds]
+    return [subgraph_file, "failed", f"{failure[0]}:{failure[1]}", seconds]
+
+
+def write_triage(results, output_csv_filepath, tol):
+    with profiling.stage("write_result") as record, open(output_csv_filepath, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Subgraph", f"{min(tol)} result", "First failing element", "Seconds"])
+        writer.writerows(results)
+        record["bytes_written"] = file.tell()
+
+    print(f"Results saved to {output_csv_filepath}")
+
+
+def generate_input_data(input_info, seed=911):
+    # a local generator gives the same values as np.random.seed(911) and is safe to use from several threads
+    random_state = np.random.RandomState(seed)
+    return [ov.Tensor(array=random_state.rand(*input.shape).astype(input.element_type.to_dtype()), shared_memory=True) for input in input_info]
+
+
+def accuracy_check_samples(subgraph_file, core, model_path_cpu, model_path_npu, tol, dp, samples=8, cache=None, target_device="NPU"):
+    """
+    Check a model on many inputs, compiling it once and reusing one infer request per device.
+    The errors of every sample are streamed into one distribution, so memory does not grow
+    with the number of samples.
+
+    Args:
+    subgraph_file (str): The name of the row.
+    core (Core): The OpenVINO core.
+    model_path_cpu (str): The CPU model (path or ov.Model).
+    model_path_npu (str): The target model (path or ov.Model).
+    tol (list): The absolute tolerances to check.
+    dp (list): The decimal places to check.
+    samples (int): The number of seeded random inputs (seeds 911, 912, ...), or an iterable of
+    input dicts keyed by tensor name (e.g. InputStore samples).
+    cache (CompiledModelCache): The compiled model cache.
+    target_device (str): The device checked against CPU.
+
+    Returns:
+    list: The statistics row.
+    """
+    profiling.set_node(subgraph_file)
+    compiled_model_npu = load_model(core, model_path_npu, target_device, cache)
+    compiled_model_cpu = load_model(core, model_path_cpu, "CPU", cache) if compiled_model_npu else None
+    if not compiled_model_npu or not compiled_model_cpu:
+        print(f"Skipping {subgraph_file} due to model loading error.")
+        return [subgraph_file] + ["Model loading failed"]
+
+    infer_request_cpu = compiled_model_cpu.create_infer_request()
+    infer_request_npu = compiled_model_npu.create_infer_request()
+    statistics = metrics.SampleStatistics(tol, dp)
+
+    print(f"Processing {subgraph_file}...")
+    sample_inputs = (generate_input_data(compiled_model_npu.inputs, 911 + i) for i in range(samples)) if isinstance(samples, int) else samples
+    for input_data in sample_inputs:
+        if isinstance(input_data, dict):
+            input_data = named_input_data(compiled_model_npu.inputs, input_data)
+            if input_data is None:
+                return [subgraph_file] + ["Missing input"]
+
+        cpu_result = perform_inference(compiled_model_cpu, input_data, infer_request_cpu)
+        npu_result = perform_inference(compiled_model_npu, input_data, infer_request_npu)
+        if cpu_result is None or npu_result is None:
+            print(f"Error during inference for {subgraph_file} (sample {statistics.samples})")
+            return [subgraph_file] + ["Inference failed"]
+
+        # the output views are overwritten by the next sample, so compare before moving on
+        with profiling.stage("compare"):
+            statistics.compare(cpu_result, npu_result)
+
+    return build_statistics_row(subgraph_file, statistics)
+
+
+def build_statistics_row(name, statistics):
+    distribution = statistics.distribution
+    return [
+        name,
+        statistics.samples,
+        f"{distribution.max:.4f}",
+        f"{distribution.mean():.6f}",
+        f"{distribution.percentile(99):.4f}",
+    ] + [f"{rate:.2%}" for rate in statistics.failure_rates()]
+
+
+def write_statistics(results, output_csv_filepath, tol, dp):
+    with profiling.stage("write_result") as record, open(output_csv_filepath, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        header = tol + [f"{dp_val}dp" for dp_val in dp]
+        writer.writerow(["Subgraph", "Samples", "Max absolute error", "Mean absolute error", "P99 absolute error"] + [f"{accuracy} failure rate" for accuracy in header])
+        writer.writerows(results)
+        record["bytes_written"] = file.tell()
+
+    print(f"Results saved to {output_csv_filepath}")
+
+
+def named_input_data(input_info, tensors):
+    # an input may carry several tensor names, any of them matches; a Parameter cut right before
+    # the Result can lose its own tensor name when compiled, so its layer name matches too
+    names = [next((name for name in sorted(input.get_names()) + [input.get_node().get_friendly_name()] if name in tensors), None) for input in input_info]
+    missing = [input.get_any_name() for input, name in zip(input_info, names) if name is None]
+    if missing:
+        print(f"Missing input tensors: {', '.join(missing)}")
+        return None
+    return [ov.Tensor(array=np.ascontiguousarray(tensors[name]), shared_memory=True) for name in names]
+
+
+def build_result_row(name, cpu_result, npu_result, tol, dp, chunk_size=metrics.DEFAULT_CHUNK_SIZE, memory_budget=None):
+    # one pass over the outputs, one output and chunk at a time, evaluates every tolerance and dp
+    # threshold and the top 5 errors; a memory_budget shrinks the chunks to what is left of it
+    # after the outputs themselves
+    outputs_bytes = sum(result.nbytes for result in cpu_result) + sum(result.nbytes for result in npu_result)
+    if memory_budget is not None:
+        chunk_size = min(chunk_size, metrics.chunk_size_for_budget(memory_budget - outputs_bytes, list(zip(cpu_result, npu_result))))
+
+    # the comparison's allocations are only traced when the memory is bounded or profiled
+    with profiling.stage("compare") as record, profiling.traced_memory(memory_budget is not None or profiling.profiler.enabled) as traced:
+        comparison = metrics.compare_outputs(cpu_result, npu_result, tol, dp, top_k=5, chunk_size=chunk_size)
+        record["bytes_read"] = outputs_bytes
+
+    peak_memory = outputs_bytes + traced["peak"] if "peak" in traced else None
+    if peak_memory is not None:
+        print(f"Peak memory of {name}: {peak_memory / 2**20:.1f} MB ({outputs_bytes / 2**20:.1f} MB outputs, {traced['peak'] / 2**20:.1f} MB comparison)")
+
     results_label = [
         f"{'passed' if passed else 'failed'} {match_percentage}"
-        for tol_val in tol
-        for passed, match_percentage in [compare_results(cpu_result, npu_result, tol_val, True)]
-    ] + [
-        f"{'passed' if passed else 'failed'} {match_percentage}"
-        for dp_val in dp
-        for passed, match_percentage in [compare_results(cpu_result, npu_result, dp_val, False)]
+        for passed, match_percentage in comparison.tol_results() + comparison.dp_results()
     ]
     
     first_5_cpu = [','.join(format_tensor_elements(tensor) for tensor in cpu_result[:5])]
     first_5_npu = [','.join(format_tensor_elements(tensor) for tensor in npu_result[:5])]
 
-    return [subgraph_file] + compare_result_absolute_error(cpu_result, npu_result) + results_label + first_5_cpu + first_5_npu
+    row_metrics = {
+        "top_errors": comparison.top_errors(),
+        "worst_elements": comparison.worst_elements(),
+        "results": comparison.tol_results() + comparison.dp_results(),
+    }
+    if peak_memory is not None:
+        row_metrics["peak_memory"] = peak_memory
+    return result_store.ResultRow([name, format_top_errors(comparison)] + results_label + first_5_cpu + first_5_npu + [format_worst_elements(comparison)], row_metrics)
+
+
+def write_result(results, output_csv_filepath, tol, dp, store=True, export_csv=True, metadata=None):
+    # the numeric columns go to a .npz next to the CSV, the CSV itself is an optional export
+    if store:
+        with profiling.stage("write_store") as record:
+            metadata = dict(metadata or {}, source=os.path.basename(output_csv_filepath), openvino=ov.get_version())
+            record["bytes_written"] = result_store.write_result_store(results, os.path.splitext(output_csv_filepath)[0] + ".npz", tol, dp, metadata)
+
+    if not export_csv:
+        return
 
-def write_result(results, output_csv_filepath, tol, dp):
-    with open(output_csv_filepath, mode='w', newline='') as file:
+    with profiling.stage("write_result") as record, open(output_csv_filepath, mode='w', newline='') as file:
         writer = csv.writer(file)
         header = tol + [f"{dp_val}dp" for dp_val in dp]
-        writer.writerow(["Subgraph", "5 highest absolute error"] + [f"{accuracy} result" for accuracy in header] + ["First 5 CPU Tensors", "First 5 NPU Tensors"])
+        writer.writerow(["Subgraph", "5 highest absolute error"] + [f"{accuracy} result" for accuracy in header] + ["First 5 CPU Tensors", "First 5 NPU Tensors", "Highest error indices"])
         writer.writerows(results)
+        record["bytes_written"] = file.tell()
 
     print(f"Results saved to {output_csv_filepath}")
\ No newline at end of file
@@ -1,48 +1,45 @@
-import edit_xml
+import graph_index
 import accuracy_check
-from lxml import objectify
+from lxml import etree
 from shutil import copyfile
 from pathlib import Path
+import numpy as np
 import openvino as ov
 import os
+import re
 import csv
+import time
+import argparse
+import journal as result_journal
+import fingerprint_store
+import profiling
 from dotenv import load_dotenv
 
 load_dotenv()
 
 def get_matched_node_list(modelpath):
-    modelpath = Path(modelpath)
-    parser = objectify.makeparser(remove_comments=True)
-    temp_tree = objectify.parse(str(modelpath), parser=parser)
-
-    if temp_tree is None:
-        raise Exception("Cannot parse model IR")
+    index = graph_index.load_graph_index(modelpath)
 
     excluded_names = {"OpenVINO-EP-subgraph", "sink_port", "GroupQueryAttention"}
 
     node_lst = [
-        node.attrib['name']
-        for node in temp_tree.iter()
-        if 'name' in node.attrib and "/model/layers." in node.attrib['name'] and not any(excluded in node.attrib['name'] for excluded in excluded_names)
+        name
+        for name in index.layer_names()
+        if "/model/layers." in name and not any(excluded in name for excluded in excluded_names)
     ]
 
     return node_lst
 
 
 def get_node_list(modelpath):
-    modelpath = Path(modelpath)
-    parser = objectify.makeparser(remove_comments=True)
-    temp_tree = objectify.parse(str(modelpath), parser=parser)
-
-    if temp_tree is None:
-        raise Exception("Cannot parse model IR")
+    index = graph_index.load_graph_index(modelpath)
 
     excluded_names = {"OpenVINO-EP-subgraph", "sink_port", "GroupQueryAttention", "Constant", "weight_scales", "weight"}
 
     node_lst = [
-        node.attrib['name']
-        for node in temp_tree.iter()
-        if 'name' in node.attrib and not any(excluded in node.attrib['name'] for excluded in excluded_names)
+        name
+        for name in index.layer_names()
+        if not any(excluded in name for excluded in excluded_names)
     ]
 
     return node_lst
@@ -57,27 +54,78 @@ def create_new_subgraph(modelpath, layername):
     if not layername:
         raise Exception("Empty layer name")
 
-    parser = objectify.makeparser(remove_comments=True)
-    tree = objectify.parse(str(modelpath), parser=parser)
-    if tree is None:
-        raise Exception("Cannot parse model IR")
-
-    edit_xml.delLayers(tree, layername)
+    index = graph_index.load_graph_index(modelpath)
+    with profiling.stage("cut"):
+        tree = index.cut(layername)
 
     new_file_name = modelpath.parent / (modelpath.stem + "-cut-" + layername.replace('/', '-') + modelpath.suffix)
-    tree.write(str(new_file_name), pretty_print=True)
+    with profiling.stage("write_xml") as record:
+        tree.write(str(new_file_name), pretty_print=True)
+        record["bytes_written"] = new_file_name.stat().st_size
 
     old_bin_path = modelpath.parent / (modelpath.stem + ".bin")
     new_bin_path = modelpath.parent / (new_file_name.stem + ".bin")
     if not new_bin_path.is_file():
-        print(f"Copying weights from {old_bin_path} to {new_bin_path}")
-        copyfile(str(old_bin_path), str(new_bin_path))
+        with profiling.stage("link_weights") as record:
+            if not link_weights(old_bin_path, new_bin_path):
+                record["bytes_written"] = new_bin_path.stat().st_size
     else:
         print(f"Can't copy weights. File already exists: {new_bin_path}")
     
     return new_file_name
 
 
+def link_weights(old_bin_path, new_bin_path):
+    # cut models only drop layers, so they can share the original weights file
+    # returns False when the weights had to be copied
+    try:
+        os.link(old_bin_path, new_bin_path)
+        print(f"Hard linking weights from {old_bin_path} to {new_bin_path}")
+        return True
+    except OSError:
+        pass
+
+    try:
+        os.symlink(Path(old_bin_path).resolve(), new_bin_path)
+        print(f"Symlinking weights from {old_bin_path} to {new_bin_path}")
+        return True
+    except OSError:
+        pass
+
+    print(f"Copying weights from {old_bin_path} to {new_bin_path}")
+    copyfile(str(old_bin_path), str(new_bin_path))
+    return False
+
+
+def load_weights(modelpath):
+    # map the .bin once per source subgraph; copy-on-write keeps the file untouched
+    # while giving OpenVINO a writable buffer it can share without copying
+    modelpath = Path(modelpath)
+    bin_path = modelpath.parent / (modelpath.stem + ".bin")
+    # an IR without Const weights has an empty (or no) .bin, which cannot be mapped
+    if not bin_path.is_file() or bin_path.stat().st_size == 0:
+        return ov.Tensor(np.empty(0, dtype=np.uint8))
+    weights = np.memmap(str(bin_path), dtype=np.uint8, mode='c')
+    return ov.Tensor(weights, shared_memory=True)
+
+
+def create_new_subgraph_in_memory(core, modelpath, layername, weights, depth=None):
+    modelpath = Path(modelpath)
+
+    if modelpath.suffix != ".xml":
+        raise Exception("Path is not to model IR file")
+
+    if not layername:
+        raise Exception("Empty layer name")
+
+    index = graph_index.load_graph_index(modelpath)
+    with profiling.stage("cut"):
+        tree = index.cut(layername, depth)
+
+    with profiling.stage("read_model"):
+        return core.read_model(etree.tostring(tree, encoding="unicode"), weights)
+
+
 def delete_subgraph_files(subgraph_path):
     subgraph_path = Path(subgraph_path)
     bin_file_to_delete = subgraph_path.parent / (subgraph_path.stem + ".bin")
@@ -95,8 +143,126 @@ def delete_subgraph_files(subgraph_path):
         print(f"BIN file does not exist: {bin_file_to_delete}")
 
 
-def accuracy_check_for_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp):
+def get_topological_node_list(modelpath, nodes):
+    wanted = set(nodes)
+    return [name for name in graph_index.load_graph_index(modelpath).topological_names() if name in wanted]
+
+
+def check_node(core, model_path_cpu, model_path_npu, node, tol, dp, weights_cpu=None, weights_npu=None, cache=None, reference_store=None, target_device="NPU", depth=None, input_data=None, memory_budget=None):
+    print(f"\nChecking accuracy for {node}...")
+    profiling.set_node(node)
+
+    if weights_npu is not None:
+        # in-memory cut: nothing is written to disk, so there is nothing to clean up
+        # (a window of depth layers is fed by name from the captured activations in input_data)
+        new_subgraph_cpu = create_new_subgraph_in_memory(core, model_path_cpu, node, weights_cpu, depth) if model_path_cpu != model_path_npu else None
+        new_subgraph_npu = create_new_subgraph_in_memory(core, model_path_npu, node, weights_npu, depth)
+
+        result = accuracy_check.accuracy_check(node, core, new_subgraph_cpu or new_subgraph_npu, new_subgraph_npu, tol, dp, cache, target_device=target_device, input_data=input_data, memory_budget=memory_budget)
+
+        print("\n============================================================================================\n")
+        return result
+
+    new_subgraph_path_cpu = create_new_subgraph(modelpath=model_path_cpu, layername=node) if model_path_cpu != model_path_npu else None
+    new_subgraph_path_npu = create_new_subgraph(modelpath=model_path_npu, layername=node)
+
+    result = accuracy_check.accuracy_check(node, core, new_subgraph_path_cpu or new_subgraph_path_npu, new_subgraph_path_npu, tol, dp, cache, reference_store, target_device, input_data, memory_budget)
+
+    if new_subgraph_path_cpu:
+        delete_subgraph_files(new_subgraph_path_cpu)
+    delete_subgraph_files(new_subgraph_path_npu)
+
+    print("\n============================================================================================\n")
+    return result
+
+
+def is_error_result(result):
+    # error rows only carry a status message such as "Model loading failed"
+    return len(result) < 3
+
+
+def is_failed_result(result):
+    # error rows, otherwise any failed tolerance/dp label
+    return is_error_result(result) or any(str(label).startswith("failed") for label in result[2:])
+
+
+def find_first_divergent_node(core, model_path_cpu, model_path_npu, nodes, tol, dp, window=0, weights_cpu=None, weights_npu=None, cache=None, target_device="NPU"):
+    # nodes must be in topological order; assumes a divergence propagates to every later node,
+    # so the pass/fail sequence is monotonic and can be searched instead of swept
+    checked = {}
+
+    def check(index):
+        if index not in checked:
+            checked[index] = check_node(core, model_path_cpu, model_path_npu, nodes[index], tol, dp, weights_cpu, weights_npu, cache, target_device=target_device)
+        return checked[index]
+
+    def verdict(index, stop):
+        # the first node from index (before stop) that compiled and ran, and whether it failed;
+        # error rows say nothing about divergence, they are reported and the search moves on
+        while index < stop:
+            if not is_error_result(check(index)):
+                return index, is_failed_result(checked[index])
+            index += 1
+        return None, False
+
+    # gallop forward until the first failing probe, then bisect between the last pass and it
+    last_passed, first_failed, end, step = -1, None, len(nodes), 1
+    while first_failed is None and last_passed < end - 1:
+        probe = min(last_passed + step, end - 1)
+        index, failed = verdict(probe, end)
+        if index is None:
+            # only error rows from the probe on, keep galloping before it
+            end, step = probe, 1
+        elif failed:
+            first_failed = index
+        else:
+            last_passed, step = index, step * 2
+
+    if first_failed is not None:
+        high = first_failed
+        while high - last_passed > 1:
+            middle = (last_passed + high) // 2
+            index, failed = verdict(middle, high)
+            if index is None:
+                high = middle
+            elif failed:
+                first_failed = high = index
+            else:
+                last_passed = index
+
+        # optionally check a small linear window around the divergence point
+        for index in range(max(0, first_failed - window), min(len(nodes), first_failed + window + 1)):
+            check(index)
+
+    return first_failed, [checked[index] for index in sorted(checked)]
+
+
+def load_source_weights(model_path_cpu, model_path_npu, in_memory):
+    if not in_memory:
+        return None, None
+
+    weights_npu = load_weights(model_path_npu)
+    weights_cpu = load_weights(model_path_cpu) if model_path_cpu != model_path_npu else weights_npu
+    return weights_cpu, weights_npu
+
+
+def get_node_fingerprints(model_path_cpu, model_path_npu, config):
+    fingerprints_cpu = graph_index.load_graph_index(model_path_cpu).fingerprints(Path(model_path_cpu).with_suffix(".bin"))
+    fingerprints_npu = graph_index.load_graph_index(model_path_npu).fingerprints(Path(model_path_npu).with_suffix(".bin")) if model_path_cpu != model_path_npu else fingerprints_cpu
+    return {node: fingerprint_store.node_fingerprint(fingerprints_cpu.get(node), fingerprints_npu.get(node), config) for node in fingerprints_npu}
+
+
+def fingerprint_path(folder, subgraph_file):
+    return os.path.join(folder, "result_" + subgraph_file.replace(".xml", ".nodes.json"))
+
+
+def accuracy_check_for_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, in_memory=False, cache=None, reference_store=None, journal=None, resume=False, target_device="NPU", input_store=None, sample_index=0, incremental=False, previous_folder=None, memory_budget=None):
+    # with an input_store every node is fed the recorded inputs of sample_index instead of random data;
+    # incremental runs only re-check nodes whose ancestor cone changed since the run in previous_folder;
+    # memory_budget (bytes) bounds the outputs and comparison workspace of every node
     core = ov.Core()
+    config = result_journal.config_key(tol, dp)
+    done = journal.load() if journal is not None and resume else {}
 
     for subgraph_file in subgraph_files:
         print(f"Processing nodes in {subgraph_file}...")
@@ -105,33 +271,439 @@ def accuracy_check_for_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgra
         
         results = []
         nodes = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+        weights_cpu, weights_npu = load_source_weights(model_path_cpu, model_path_npu, in_memory)
+        input_data = input_store.load(subgraph_file, sample_index) if input_store is not None else None
+
+        if incremental:
+            fingerprints = get_node_fingerprints(model_path_cpu, model_path_npu, config)
+            previous = fingerprint_store.FingerprintStore(fingerprint_path(previous_folder or output_folder, subgraph_file)).load()
+            reused = 0
         
         for node in nodes:
-            print(f"\nChecking accuracy for {node}...")
+            if (subgraph_file, node, config) in done:
+                print(f"Skipping {node}, already checked")
+                results.append(done[(subgraph_file, node, config)])
+                continue
 
-            new_subgraph_path_cpu = create_new_subgraph(modelpath=model_path_cpu, layername=node) if model_path_cpu != model_path_npu else None
-            new_subgraph_path_npu = create_new_subgraph(modelpath=model_path_npu, layername=node)
+            # only rows of successful checks are copied forward, failed compiles or inferences are retried
+            if incremental and node in previous and previous[node][0] == fingerprints[node] and previous[node][1].metrics is not None:
+                print(f"Reusing {node}, ancestor cone unchanged")
+                results.append(previous[node][1])
+                reused += 1
+                continue
 
-            results.append(accuracy_check.accuracy_check(node, core, new_subgraph_path_cpu or new_subgraph_path_npu, new_subgraph_path_npu, tol, dp))
-
-            if new_subgraph_path_cpu:
-                delete_subgraph_files(new_subgraph_path_cpu)
-            delete_subgraph_files(new_subgraph_path_npu)
-
-            print("\n============================================================================================\n")
+            result = check_node(core, model_path_cpu, model_path_npu, node, tol, dp, weights_cpu, weights_npu, cache, reference_store, target_device, input_data=input_data, memory_budget=memory_budget)
+            if journal is not None:
+                journal.append(subgraph_file, node, config, result)
+            results.append(result)
         
         accuracy_check.write_result(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml",".csv")), tol=tol, dp=dp)
+
+        if incremental:
+            fingerprint_store.FingerprintStore(fingerprint_path(output_folder, subgraph_file)).save({node: (fingerprints[node], result) for node, result in zip(nodes, results)})
+            print(f"{subgraph_file}: reused {reused}, re-checked {len(nodes) - reused} of {len(nodes)} nodes")
         print("\n############################################################################################\n\n")
+
+    if cache is not None:
+        cache.report()
         
         
-def accuracy_check_for_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_folder, tol, dp):
+def accuracy_check_for_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_folder, tol, dp, in_memory=False, cache=None, reference_store=None, journal=None, resume=False, incremental=False, previous_folder=None, memory_budget=None):
     subgraph_files_cpu = {f for f in os.listdir(subgraph_folder_cpu) if f.endswith('.xml')}
     subgraph_files_npu = {f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml')}
     subgraph_files = subgraph_files_cpu & subgraph_files_npu
-    accuracy_check_for_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp)
-    
+    accuracy_check_for_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, in_memory, cache, reference_store, journal, resume, incremental=incremental, previous_folder=previous_folder, memory_budget=memory_budget)
+
+
+def accuracy_check_for_subgraph_bisect(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, window=0, in_memory=False, cache=None, target_device="NPU"):
+    core = ov.Core()
+
+    for subgraph_file in subgraph_files:
+        print(f"Searching first divergent node in {subgraph_file}...")
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+
+        nodes = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+        nodes = get_topological_node_list(modelpath=model_path_npu, nodes=nodes)
+
+        weights_cpu, weights_npu = load_source_weights(model_path_cpu, model_path_npu, in_memory)
+
+        first_failed, results = find_first_divergent_node(core, model_path_cpu, model_path_npu, nodes, tol, dp, window, weights_cpu, weights_npu, cache, target_device)
+        if first_failed is None:
+            print(f"No divergent node found in {subgraph_file} ({len(results)} of {len(nodes)} nodes checked)")
+        else:
+            print(f"First divergent node in {subgraph_file}: {nodes[first_failed]} ({len(results)} of {len(nodes)} nodes checked)")
+        errors = [result[0] for result in results if is_error_result(result)]
+        if errors:
+            print(f"Skipped {len(errors)} nodes that could not be checked: {', '.join(errors)}")
+
+        accuracy_check.write_result(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml","_bisect.csv")), tol=tol, dp=dp)
+        print("\n############################################################################################\n\n")
+
+
+def tap_node_outputs(model, nodes):
+    # mark every node as an extra model output instead of cutting one model per node
+    ops = {op.get_friendly_name(): op for op in model.get_ops()}
+
+    tapped_nodes = []
+    tapped_outputs = []
+    for node in nodes:
+        op = ops.get(node)
+        if op is None:
+            print(f"Cannot find node {node} in model")
+            continue
+
+        # a Result has nothing to cut, so tap the tensor it already returns
+        if op.get_type_name() == "Result":
+            tapped_outputs.append(op.input_value(0))
+        elif op.get_output_size() > 0:
+            tapped_outputs.append(op.output(0))
+        else:
+            continue
+        tapped_nodes.append(node)
+
+    if tapped_outputs:
+        model.add_outputs(tapped_outputs)
+
+    return {node: model.get_result_index(output) for node, output in zip(tapped_nodes, tapped_outputs)}
+
+
+def tapped_accuracy_check(core, model_path_cpu, model_path_npu, nodes, tol, dp, cache=None, target_device="NPU"):
+    model_cpu = core.read_model(model_path_cpu)
+    model_npu = core.read_model(model_path_npu) if model_path_cpu != model_path_npu else model_cpu
+
+    output_index_cpu = tap_node_outputs(model_cpu, nodes)
+    output_index_npu = tap_node_outputs(model_npu, nodes) if model_npu is not model_cpu else output_index_cpu
+
+    compiled_model_cpu = accuracy_check.load_model(core, model_cpu, "CPU", cache)
+    compiled_model_npu = accuracy_check.load_model(core, model_npu, target_device, cache)
+    if not compiled_model_cpu or not compiled_model_npu:
+        print(f"Skipping {len(nodes)} nodes due to model loading error.")
+        return [[node, "Model loading failed"] for node in nodes]
+
+    input_data = accuracy_check.generate_input_data(compiled_model_npu.inputs)
+
+    cpu_result = accuracy_check.perform_inference(compiled_model_cpu, input_data)
+    npu_result = accuracy_check.perform_inference(compiled_model_npu, input_data) if cpu_result is not None else None
+    if cpu_result is None or npu_result is None:
+        print(f"Error during inference for {len(nodes)} tapped nodes")
+        return [[node, "Inference failed"] for node in nodes]
+
+    results = []
+    for node in nodes:
+        if node not in output_index_cpu or node not in output_index_npu:
+            results.append([node, "Node not found"])
+            continue
+
+        cpu_tensor = cpu_result[output_index_cpu[node]]
+        npu_tensor = npu_result[output_index_npu[node]]
+        results.append(accuracy_check.build_result_row(node, [cpu_tensor], [npu_tensor], tol, dp))
+
+    return results
+
+
+def accuracy_check_for_subgraph_tapped(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, chunk_size=64, cache=None, target_device="NPU"):
+    # same per-node rows as accuracy_check_for_subgraph, but one compile per device for every chunk_size nodes
+    core = ov.Core()
+
+    for subgraph_file in subgraph_files:
+        print(f"Processing nodes in {subgraph_file}...")
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+
+        results = []
+        nodes = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+
+        for start in range(0, len(nodes), chunk_size):
+            chunk = nodes[start:start + chunk_size]
+            profiling.set_node(f"{subgraph_file}[{start}:{start + len(chunk)}]")
+            print(f"\nChecking accuracy for nodes {start + 1}-{start + len(chunk)} of {len(nodes)}...")
+            results.extend(tapped_accuracy_check(core, model_path_cpu, model_path_npu, chunk, tol, dp, cache, target_device))
+
+        accuracy_check.write_result(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml",".csv")), tol=tol, dp=dp)
+        print("\n############################################################################################\n\n")
+
+
+def check_node_samples(core, model_path_cpu, model_path_npu, node, tol, dp, samples, weights_cpu=None, weights_npu=None, target_device="NPU"):
+    print(f"\nChecking accuracy for {node}...")
+    profiling.set_node(node)
+
+    if weights_npu is not None:
+        new_subgraph_cpu = create_new_subgraph_in_memory(core, model_path_cpu, node, weights_cpu) if model_path_cpu != model_path_npu else None
+        new_subgraph_npu = create_new_subgraph_in_memory(core, model_path_npu, node, weights_npu)
+        return accuracy_check.accuracy_check_samples(node, core, new_subgraph_cpu or new_subgraph_npu, new_subgraph_npu, tol, dp, samples, target_device=target_device)
+
+    new_subgraph_path_cpu = create_new_subgraph(modelpath=model_path_cpu, layername=node) if model_path_cpu != model_path_npu else None
+    new_subgraph_path_npu = create_new_subgraph(modelpath=model_path_npu, layername=node)
+
+    result = accuracy_check.accuracy_check_samples(node, core, new_subgraph_path_cpu or new_subgraph_path_npu, new_subgraph_path_npu, tol, dp, samples, target_device=target_device)
+
+    if new_subgraph_path_cpu:
+        delete_subgraph_files(new_subgraph_path_cpu)
+    delete_subgraph_files(new_subgraph_path_npu)
+    return result
+
+
+def accuracy_check_for_subgraph_samples(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, num_samples=8, input_store=None, in_memory=False, target_device="NPU"):
+    # per-node distribution over num_samples seeded inputs (or every sample recorded in input_store),
+    # each cut is compiled once per device and every sample runs through the same infer request
+    core = ov.Core()
+
+    for subgraph_file in subgraph_files:
+        print(f"Processing nodes in {subgraph_file}...")
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+
+        nodes = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+        weights_cpu, weights_npu = load_source_weights(model_path_cpu, model_path_npu, in_memory)
+
+        results = []
+        for node in nodes:
+            # recorded samples are mapped lazily again for every node
+            samples = (input_data for _, input_data in input_store.samples(subgraph_file)) if input_store is not None else num_samples
+            results.append(check_node_samples(core, model_path_cpu, model_path_npu, node, tol, dp, samples, weights_cpu, weights_npu, target_device))
+
+        accuracy_check.write_statistics(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml", "_samples.csv")), tol=tol, dp=dp)
+        print("\n############################################################################################\n\n")
+
+
+def capture_activations(core, model_path, tensors):
+    """
+    Run the full model once on CPU with every requested tensor tapped as an extra output.
+
+    Args:
+    core (Core): The OpenVINO core.
+    model_path (str): The full model IR.
+    tensors (list): The (producer name, output index) of the tensors to capture.
+
+    Returns:
+    dict: The captured arrays keyed by graph_index.boundary_tensor_name.
+    """
+    model = core.read_model(model_path)
+    ops = {op.get_friendly_name(): op for op in model.get_ops()}
+
+    tapped = []
+    for producer, output_index in tensors:
+        op = ops.get(producer)
+        if op is None or output_index >= op.get_output_size():
+            print(f"Cannot find tensor {producer}:{output_index} in model")
+            continue
+        tapped.append((graph_index.boundary_tensor_name(producer, output_index), op.output(output_index)))
+
+    if tapped:
+        model.add_outputs([output for _, output in tapped])
+
+    compiled_model = accuracy_check.load_model(core, model, "CPU")
+    if not compiled_model:
+        return {}
+
+    # kept alive until the copies are made: a tapped Parameter's output aliases its input buffer
+    input_data = accuracy_check.generate_input_data(compiled_model.inputs)
+    result = accuracy_check.perform_inference(compiled_model, input_data)
+    if result is None:
+        return {}
+
+    # copies: the views are only valid as long as the infer request and the inputs live
+    return {name: np.array(result[model.get_result_index(output)]) for name, output in tapped}
+
+
+def accuracy_check_for_subgraph_windowed(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, depth=1, target_device="NPU"):
+    # every node is checked on a window of depth layers whose upstream inputs are the CPU
+    # activations of one full run, so the cost per node does not grow with its depth and a
+    # failure is local to the window instead of inherited from upstream
+    core = ov.Core()
+
+    for subgraph_file in subgraph_files:
+        print(f"Processing nodes in {subgraph_file} (window depth {depth})...")
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+
+        nodes = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+        weights_cpu, weights_npu = load_source_weights(model_path_cpu, model_path_npu, in_memory=True)
+
+        index = graph_index.load_graph_index(model_path_cpu)
+        tensors = list(dict.fromkeys(tensor for node in nodes for tensor in index.window_inputs(node, depth)))
+        profiling.set_node(subgraph_file)
+        with profiling.stage("capture"):
+            activations = capture_activations(core, model_path_cpu, tensors)
+        print(f"Captured {len(activations)} of {len(tensors)} window inputs")
+
+        results = [
+            check_node(core, model_path_cpu, model_path_npu, node, tol, dp, weights_cpu, weights_npu, target_device=target_device, depth=depth, input_data=activations)
+            for node in nodes
+        ]
+
+        accuracy_check.write_result(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml", f"_window{depth}.csv")), tol=tol, dp=dp)
+        print("\n############################################################################################\n\n")
+
+
+# the same place in every repeated decoder block, e.g. /model/layers.*/self_attn/MatMul
+BLOCK_PATTERN = re.compile(r'/model/layers\.\d+/')
+ERROR_PROFILE_FILE = "op_type_error_profile.csv"
+
+
+def get_node_groups(modelpath, nodes):
+    # nodes of one op type at the same place in every /model/layers.N block form one group,
+    # nodes outside the blocks are a group of their own
+    index = graph_index.load_graph_index(modelpath)
+    groups = {}
+    for node in nodes:
+        groups.setdefault((index.get_layer(node).get("type"), BLOCK_PATTERN.sub("/model/layers.*/", node)), []).append(node)
+    return groups
+
+
+def spread_order(members):
+    # first, last, then the middle of every gap in turn, so any prefix covers the blocks evenly
+    order = [0] + ([len(members) - 1] if len(members) > 1 else [])
+    gaps = [(0, len(members) - 1)]
+    while gaps:
+        low, high = gaps.pop(0)
+        if high - low < 2:
+            continue
+        middle = (low + high) // 2
+        order.append(middle)
+        gaps += [(low, middle), (middle, high)]
+    return [members[i] for i in order]
+
+
+def max_error(result):
+    # highest absolute error of a row, NaN ranks highest and error rows (no metrics) lowest
+    row_metrics = getattr(result, "metrics", None)
+    if not row_metrics or not row_metrics["top_errors"]:
+        return -1.0
+    return float(np.nan_to_num(row_metrics["top_errors"][0], nan=np.inf))
+
+
+def group_error(results):
+    return max((max_error(result) for result in results), default=-1.0)
+
+
+def accuracy_check_for_subgraph_sampled(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, time_budget=1800, samples_per_group=1, in_memory=True, cache=None, target_device="NPU"):
+    """
+    Time-boxed sweep: check samples_per_group nodes of every group (op type and place in the
+    repeated /model/layers.N blocks) first, then keep checking the group with the highest
+    error so far until time_budget is spent or every node is checked. Writes the checked nodes
+    per subgraph (result_<subgraph>_sampled.csv) and an error profile per op type.
+
+    Args:
+    subgraph_folder_cpu (str): The folder of the CPU subgraph IRs.
+    subgraph_folder_npu (str): The folder of the NPU subgraph IRs.
+    subgraph_files (list): The subgraph IR file names.
+    output_folder (str): The folder of the results.
+    tol (list): The absolute tolerances to check.
+    dp (list): The decimal places to check.
+    time_budget (float): The seconds to spend on checking.
+    samples_per_group (int): The nodes checked per group before ranking the groups.
+    in_memory (bool): Cut the nodes in memory instead of writing IR files.
+    cache (CompiledModelCache): The compiled model cache.
+    target_device (str): The device checked against CPU.
+
+    Returns:
+    dict: The checked result rows per group, keyed by (subgraph, op type, node pattern).
+    """
+    core = ov.Core()
+    deadline = time.monotonic() + time_budget
+
+    groups = {}
+    nodes = {}
+    for subgraph_file in subgraph_files:
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+        nodes[subgraph_file] = get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else get_node_list(modelpath=model_path_npu)
+        for (op_type, pattern), members in get_node_groups(model_path_npu, nodes[subgraph_file]).items():
+            groups[(subgraph_file, op_type, pattern)] = spread_order(members)
+
+    checked = {key: [] for key in groups}
+    weights = {}
+
+    def check(key):
+        subgraph_file = key[0]
+        model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+        model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+        if subgraph_file not in weights:
+            weights[subgraph_file] = load_source_weights(model_path_cpu, model_path_npu, in_memory)
+        weights_cpu, weights_npu = weights[subgraph_file]
+        node = groups[key][len(checked[key])]
+        checked[key].append(check_node(core, model_path_cpu, model_path_npu, node, tol, dp, weights_cpu, weights_npu, cache, target_device=target_device))
+
+    # every group is sampled before any group gets a second look
+    for _ in range(samples_per_group):
+        for key in groups:
+            if time.monotonic() < deadline and len(checked[key]) < len(groups[key]):
+                check(key)
+
+    # then the budget goes to the group with the highest error so far
+    while time.monotonic() < deadline:
+        remaining = [key for key in groups if len(checked[key]) < len(groups[key])]
+        if not remaining:
+            break
+        check(max(remaining, key=lambda key: group_error(checked[key])))
+
+    total_checked = sum(len(results) for results in checked.values())
+    total_nodes = sum(len(members) for members in groups.values())
+    print(f"Checked {total_checked} of {total_nodes} nodes in {len(groups)} groups")
+    print("\nGroups with highest absolute error")
+    for key in sorted(checked, key=lambda key: group_error(checked[key]), reverse=True)[:10]:
+        print(f"{group_error(checked[key]):>12.4f}  {len(checked[key])}/{len(groups[key])}  {key[0]} {key[1]} {key[2]}")
+
+    for subgraph_file in subgraph_files:
+        rows = {result[0]: result for key, results in checked.items() if key[0] == subgraph_file for result in results}
+        if rows:
+            # in node list order, like a full sweep
+            results = [rows[node] for node in nodes[subgraph_file] if node in rows]
+            accuracy_check.write_result(results=results, output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml", "_sampled.csv")), tol=tol, dp=dp)
+
+    write_error_profile(groups, checked, os.path.join(output_folder, ERROR_PROFILE_FILE), tol, dp)
+    return checked
+
+
+def write_error_profile(groups, checked, output_csv_filepath, tol, dp):
+    # one row per op type, highest error first: how many nodes exist and were checked, the
+    # highest and mean of the checked nodes' highest errors, and the failures per threshold
+    profile = {}
+    for key, members in groups.items():
+        entry = profile.setdefault(key[1], {"groups": 0, "nodes": 0, "results": []})
+        entry["groups"] += 1
+        entry["nodes"] += len(members)
+        entry["results"] += [(key[0], result) for result in checked[key]]
+
+    rows = []
+    for op_type, entry in profile.items():
+        errors = [max_error(result) for _, result in entry["results"]]
+        measured = [error for error in errors if error >= 0]
+        worst = max(range(len(errors)), key=lambda i: errors[i], default=None)
+        # error rows (compile or inference failed) count as failed at every threshold
+        failed = [0] * (len(tol) + len(dp))
+        for _, result in entry["results"]:
+            row_metrics = getattr(result, "metrics", None)
+            for i, (passed, _) in enumerate(row_metrics["results"] if row_metrics else [(False, 0)] * len(failed)):
+                failed[i] += not passed
+        rows.append([
+            op_type,
+            entry["groups"],
+            entry["nodes"],
+            len(entry["results"]),
+            f"{max(measured):.4f}" if measured else "",
+            f"{np.mean(measured):.6f}" if measured else "",
+            f"{entry['results'][worst][0]}:{entry['results'][worst][1][0]}" if worst is not None and errors[worst] >= 0 else "",
+        ] + failed)
+
+    rows.sort(key=lambda row: float(row[4]) if row[4] else -1.0, reverse=True)
+    with open(output_csv_filepath, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        header = tol + [f"{dp_val}dp" for dp_val in dp]
+        writer.writerow(["Op type", "Groups", "Nodes", "Checked", "Max absolute error", "Mean highest absolute error", "Worst node"] + [f"{accuracy} failed" for accuracy in header])
+        writer.writerows(rows)
+
+    print(f"Error profile saved to {output_csv_filepath}")
+
+
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="skip nodes already recorded in the journal")
+    args = parser.parse_args()
+
     subgraph_folder_cpu = os.getenv('CPU_SUBGRAPH_FOLDER')
     subgraph_folder_npu = os.getenv('NPU_SUBGRAPH_FOLDER')
     tol = [0.01,0.001]
@@ -146,4 +718,35 @@ if __name__ == "__main__":
     output_folder = os.getenv('OUTPUT_FOLDER_NPU')
     # accuracy_check_for_subgraph_all(subgraph_folder_npu, subgraph_folder_npu, output_folder, tol, dp)
     subgraph_files = ["OpenVINO-EP-subgraph_16.xml"]
-    accuracy_check_for_subgraph(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp)
\ No newline at end of file
+    # every checked node is appended to the journal, rerun with --resume after a crash or Ctrl-C
+    journal = result_journal.ResultJournal(os.getenv('JOURNAL_FILE') or os.path.join(output_folder, "journal.jsonl"))
+
+    # per-stage timings, summary table and Chrome trace when PROFILE_DIR is set
+    if os.getenv('PROFILE_DIR'):
+        profiling.enable()
+
+    accuracy_check_for_subgraph(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, journal=journal, resume=args.resume)
+
+    if os.getenv('PROFILE_DIR'):
+        profiling.report(os.getenv('PROFILE_DIR'))
+
+    # after a model/export update: only re-check nodes whose ancestor cone changed, copy the other rows forward
+    # accuracy_check_for_subgraph_all(subgraph_folder_npu, subgraph_folder_npu, output_folder, tol, dp, incremental=True)
+
+    # cut models in memory and share the memory-mapped weights instead of writing .xml/.bin per node
+    # accuracy_check_for_subgraph(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, in_memory=True)
+
+    # search the first node (topological order) that fails any tolerance, then check 2 nodes around it
+    # accuracy_check_for_subgraph_bisect(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, [0.001], [], window=2)
+
+    # single compile per device with all nodes tapped as extra outputs (64 nodes per compile)
+    # accuracy_check_for_subgraph_tapped(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, chunk_size=64)
+
+    # per-node max/mean/p99 error and failure rates over 16 seeded inputs, one compile per node and device
+    # accuracy_check_for_subgraph_samples(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, num_samples=16, in_memory=True)
+
+    # check each node on a window of 2 layers fed with activations captured from one full CPU run
+    # accuracy_check_for_subgraph_windowed(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, depth=2)
+
+    # time-boxed: one node per (op type, block position) group first, then the worst groups, for 30 minutes
+    # accuracy_check_for_subgraph_sampled(subgraph_folder_npu, subgraph_folder_npu, subgraph_files, output_folder, tol, dp, time_budget=30 * 60)
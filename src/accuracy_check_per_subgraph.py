@@ -1,17 +1,39 @@
 import accuracy_check
+import model_cache
+import reference_store as reference
+import input_store as recorded_inputs
 import os
+import argparse
+import threading
+import journal as result_journal
+import profiling
 import openvino as ov
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def accuracy_check_per_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp):
+def accuracy_check_per_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp, cache=None, reference_store=None, journal=None, resume=False, input_store=None, memory_budget=None, target_device="NPU"):
     core = ov.Core()
+    config = result_journal.config_key(tol, dp)
+    done = journal.load() if journal is not None and resume else {}
     
-    results = [
-        accuracy_check.accuracy_check(subgraph_file, core, os.path.join(subgraph_folder_cpu, subgraph_file), os.path.join(subgraph_folder_npu, subgraph_file), tol, dp)
-        for subgraph_file in subgraph_files
-    ]
+    results = []
+    for subgraph_file in subgraph_files:
+        # one row per recorded sample ("<subgraph>:sample<k>") when replaying, otherwise one row with random inputs
+        samples = input_store.samples(subgraph_file) if input_store is not None else [(None, None)]
+        for sample_index, input_data in samples:
+            name = subgraph_file if sample_index is None else f"{subgraph_file}:sample{sample_index}"
+            node = None if sample_index is None else f"sample{sample_index}"
+            if (subgraph_file, node, config) in done:
+                print(f"Skipping {name}, already checked")
+                results.append(done[(subgraph_file, node, config)])
+                continue
+
+            result = accuracy_check.accuracy_check(name, core, os.path.join(subgraph_folder_cpu, subgraph_file), os.path.join(subgraph_folder_npu, subgraph_file), tol, dp, cache, reference_store, target_device, input_data=input_data, memory_budget=memory_budget)
+            if journal is not None:
+                journal.append(subgraph_file, node, config, result)
+            results.append(result)
     
     # Sort results by subgraph filename
     results.sort(key=lambda x: accuracy_check.extract_number(x[0]))
@@ -19,22 +41,147 @@ def accuracy_check_per_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgra
     # Store results to CSV
     accuracy_check.write_result(results=results, output_csv_filepath=output_csv, tol=tol, dp=dp)
 
-def accuracy_check_per_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_csv, tol, dp):
+    if cache is not None:
+        cache.report()
+
+def accuracy_check_per_subgraph_parallel(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp, cache=None, compile_workers=2, cpu_jobs=1, npu_jobs=1, max_pending_compares=2, target_device="NPU"):
+    # pipelined variant of accuracy_check_per_subgraph: compile_workers subgraphs are compiled at once,
+    # CPU and target inference of a subgraph run concurrently (at most cpu_jobs/npu_jobs per device),
+    # and the comparison of one subgraph overlaps with the inference of the next
+    core = ov.Core()
+    # separate slots even when the target is CPU too, the reference and the target are still two jobs
+    cpu_slots = threading.Semaphore(cpu_jobs)
+    target_slots = threading.Semaphore(npu_jobs)
+    # outputs waiting for a comparison are held in memory, a compile worker waits here when too many are queued
+    compare_slots = threading.Semaphore(max_pending_compares)
+
+    def infer(slots, compiled_model, input_data):
+        with slots:
+            return accuracy_check.perform_inference(compiled_model, input_data)
+
+    def compare(subgraph_file, cpu_result, npu_result, input_data):
+        # input_data is only held: an output can alias its input buffer, which must outlive the comparison
+        try:
+            if cpu_result is None or npu_result is None:
+                print(f"Error during {'CPU' if cpu_result is None else target_device} inference for {subgraph_file}")
+                return [subgraph_file] + ["Inference failed"]
+            return accuracy_check.build_result_row(subgraph_file, cpu_result, npu_result, tol, dp)
+        finally:
+            compare_slots.release()
+
+    with ThreadPoolExecutor(compile_workers) as compile_pool, ThreadPoolExecutor(cpu_jobs + npu_jobs) as infer_pool, ThreadPoolExecutor(1) as compare_pool:
+        def check(subgraph_file):
+            compiled_model_cpu = accuracy_check.load_model(core, os.path.join(subgraph_folder_cpu, subgraph_file), "CPU", cache)
+            compiled_model_npu = accuracy_check.load_model(core, os.path.join(subgraph_folder_npu, subgraph_file), target_device, cache)
+            if not compiled_model_cpu or not compiled_model_npu:
+                print(f"Skipping {subgraph_file} due to model loading error.")
+                return [subgraph_file] + ["Model loading failed"]
+
+            print(f"Processing {subgraph_file}...")
+            input_data = accuracy_check.generate_input_data(compiled_model_npu.inputs)
+
+            cpu_future = infer_pool.submit(infer, cpu_slots, compiled_model_cpu, input_data)
+            npu_future = infer_pool.submit(infer, target_slots, compiled_model_npu, input_data)
+            cpu_result, npu_result = cpu_future.result(), npu_future.result()
+
+            # hand the comparison over and free this worker for the next compile, released when compared
+            compare_slots.acquire()
+            return compare_pool.submit(compare, subgraph_file, cpu_result, npu_result, input_data)
+
+        stage_futures = [compile_pool.submit(check, subgraph_file) for subgraph_file in subgraph_files]
+        results = [stage.result() for stage in stage_futures]
+        results = [result.result() if isinstance(result, Future) else result for result in results]
+
+    # Sort results by subgraph filename
+    results.sort(key=lambda x: accuracy_check.extract_number(x[0]))
+
+    # Store results to CSV
+    accuracy_check.write_result(results=results, output_csv_filepath=output_csv, tol=tol, dp=dp)
+
+    if cache is not None:
+        cache.report()
+
+def accuracy_check_per_subgraph_samples(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp, num_samples=8, input_store=None, cache=None):
+    # distribution over num_samples seeded inputs (or every sample recorded in input_store) instead of one verdict
+    core = ov.Core()
+
+    results = []
+    for subgraph_file in subgraph_files:
+        samples = (input_data for _, input_data in input_store.samples(subgraph_file)) if input_store is not None else num_samples
+        results.append(accuracy_check.accuracy_check_samples(subgraph_file, core, os.path.join(subgraph_folder_cpu, subgraph_file), os.path.join(subgraph_folder_npu, subgraph_file), tol, dp, samples, cache))
+
+    results.sort(key=lambda x: accuracy_check.extract_number(x[0]))
+    accuracy_check.write_statistics(results=results, output_csv_filepath=output_csv, tol=tol, dp=dp)
+
+def accuracy_check_per_subgraph_triage(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, cache=None, compile_timeout=300, infer_timeout=60, target_device="NPU"):
+    # pass/fail at the tightest tolerance only, with hung compiles and inferences recorded as timeouts
+    core = ov.Core()
+
+    results = []
+    for subgraph_file in subgraph_files:
+        results.append(accuracy_check.triage_check(subgraph_file, core, os.path.join(subgraph_folder_cpu, subgraph_file), os.path.join(subgraph_folder_npu, subgraph_file), tol, cache, target_device, compile_timeout, infer_timeout))
+
+    results.sort(key=lambda x: accuracy_check.extract_number(x[0]))
+    accuracy_check.write_triage(results=results, output_csv_filepath=output_csv, tol=tol)
+
+    failed = [row[0] for row in results if row[1] != "passed"]
+    print(f"{len(results) - len(failed)} of {len(results)} subgraphs passed at tolerance {min(tol)}")
+
+def accuracy_check_per_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_csv, tol, dp, cache=None, reference_store=None, journal=None, resume=False, input_store=None, memory_budget=None, target_device="NPU"):
     subgraph_files_cpu = {f for f in os.listdir(subgraph_folder_cpu) if f.endswith('.xml')}
     subgraph_files_npu = {f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml')}
     subgraph_files = subgraph_files_cpu & subgraph_files_npu
     
-    accuracy_check_per_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp)
+    accuracy_check_per_subgraph(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp, cache, reference_store, journal, resume, input_store, memory_budget, target_device)
     
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="skip subgraphs already recorded in the journal")
+    parser.add_argument("--triage", action="store_true", help="only pass/fail at the tightest tolerance, stopping at the first failing chunk")
+    parser.add_argument("--compile-timeout", type=float, default=300, help="seconds before a triage compile is recorded as a timeout")
+    parser.add_argument("--infer-timeout", type=float, default=60, help="seconds before a triage inference is recorded as a timeout")
+    args = parser.parse_args()
+
     subgraph_folder_cpu = os.getenv('CPU_SUBGRAPH_FOLDER')
     subgraph_folder_npu = os.getenv('NPU_SUBGRAPH_FOLDER')
     tol = [0.01,0.001]
     dp = [4] 
     
+    # reuse compiled models from previous runs (MODEL_CACHE_DIR unset keeps the cache in memory only)
+    cache = model_cache.CompiledModelCache(cache_dir=os.getenv('MODEL_CACHE_DIR'))
+
+    # run CPU inference once per model/input and reuse it in NPU-only reruns
+    reference_store = reference.ReferenceStore(os.getenv('REFERENCE_STORE_DIR')) if os.getenv('REFERENCE_STORE_DIR') else None
+
+    # replay the subgraph inputs recorded by input_store.py (one row per sample) instead of random inputs
+    input_store = recorded_inputs.InputStore(os.getenv('INPUT_STORE_DIR')) if os.getenv('INPUT_STORE_DIR') else None
+
+    # bound the outputs and comparison workspace of every check, e.g. to run several checks side by side
+    memory_budget = int(float(os.getenv('MEMORY_BUDGET_MB')) * 2**20) if os.getenv('MEMORY_BUDGET_MB') else None
+
     # check with respective subgraphs
     output_csv = os.getenv('OUTPUT_CSV')
-    accuracy_check_per_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_csv, tol, dp) 
+    # every checked subgraph is appended to the journal, rerun with --resume after a crash or Ctrl-C
+    journal = result_journal.ResultJournal(os.getenv('JOURNAL_FILE') or output_csv.replace(".csv", "_journal.jsonl"))
+    # per-stage timings, summary table and Chrome trace when PROFILE_DIR is set
+    if os.getenv('PROFILE_DIR'):
+        profiling.enable()
+
+    if args.triage:
+        subgraph_files = {f for f in os.listdir(subgraph_folder_cpu) if f.endswith('.xml')} & {f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml')}
+        accuracy_check_per_subgraph_triage(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv.replace(".csv", "_triage.csv"), tol, cache, args.compile_timeout, args.infer_timeout)
+    else:
+        accuracy_check_per_subgraph_all(subgraph_folder_cpu, subgraph_folder_npu, output_csv, tol, dp, cache, reference_store, journal, args.resume, input_store, memory_budget) 
+
+    if os.getenv('PROFILE_DIR'):
+        profiling.report(os.getenv('PROFILE_DIR'))
+
+    # 32 seeded inputs per subgraph, max/mean/p99 error and failure rate per threshold
+    # accuracy_check_per_subgraph_samples(subgraph_folder_cpu, subgraph_folder_npu, sorted(os.listdir(subgraph_folder_npu)), output_csv.replace(".csv", "_samples.csv"), tol, dp, num_samples=32, cache=cache)
+
+    # pipelined: 2 compile workers, CPU and NPU inference overlapped, comparison overlapped with the next inference
+    # subgraph_files = sorted({f for f in os.listdir(subgraph_folder_cpu) if f.endswith('.xml')} & {f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml')})
+    # accuracy_check_per_subgraph_parallel(subgraph_folder_cpu, subgraph_folder_npu, subgraph_files, output_csv, tol, dp, cache, compile_workers=2, cpu_jobs=1, npu_jobs=1, max_pending_compares=2, target_device="NPU")
     
     # check with npu subgraphs
     # output_csv = os.getenv('OUTPUT_CSV_NPU')
@@ -1,82 +1,188 @@
-# This script analyzes subgraph results from CSV files in the specified directory.
-# It identifies subgraphs with non-positive absolute errors and finds the subgraph with the highest absolute error.
+# This script analyzes subgraph results from CSV files or result stores (.npz) in the specified directories.
+# It identifies subgraph nodes with positive absolute errors and finds the node with the highest absolute error per subgraph.
+# Both questions are answered with vectorized queries, over one run or many runs at once.
 
 import os
+import numpy as np
 import pandas as pd
+import result_store
+
+EXCLUDE_FILES = ['result_subgraphs.csv', 'subgraph_nodes_with_highest-abs-err.csv', 'subgraph_nodes_with_positive_abs_err.csv', 'op_type_error_profile.csv', '']  # Add more files to exclude if needed
 
 def get_csv_files(directory, exclude_files):
     """
     Get a list of CSV files in the directory, excluding the specified files.
-    
+
     Args:
     directory (str): The directory to search for CSV files.
     exclude_files (list): The files to exclude from the search.
-    
+
     Returns:
     list: A list of CSV file names.
     """
     return [f for f in os.listdir(directory) if f.endswith('.csv') and f not in exclude_files]
 
+def get_store_files(directory):
+    """
+    Get a list of result store files in the directory.
+
+    Args:
+    directory (str): The directory to search for result stores.
+
+    Returns:
+    list: A list of .npz file names.
+    """
+    return [f for f in os.listdir(directory) if f.startswith('result_') and f.endswith('.npz')]
+
+def load_csv_results(directory, exclude_files=EXCLUDE_FILES):
+    """
+    Load the result CSV files of a directory into one table. The highest absolute error of
+    each node is parsed from the first value of the '5 highest absolute error' column.
+
+    Args:
+    directory (str): The directory containing the CSV files.
+    exclude_files (list): The files to exclude.
+
+    Returns:
+    DataFrame: One row per node with the columns subgraph, node, 5 absolute error and max_error.
+    """
+    frames = []
+    for csv_file in get_csv_files(directory, exclude_files):
+        print(f"Checking {csv_file} .....")
+        # samples, triage and error profile CSVs have other columns, only per node results are loaded
+        if not {'Subgraph', '5 highest absolute error'} <= set(pd.read_csv(os.path.join(directory, csv_file), nrows=0).columns):
+            print(f"Skipping {csv_file}, it has no per node errors")
+            continue
+        df = pd.read_csv(os.path.join(directory, csv_file), usecols=['Subgraph', '5 highest absolute error'])
+        frames.append(pd.DataFrame({
+            'subgraph': csv_file.replace("result_", ""),
+            'node': df['Subgraph'],
+            '5 absolute error': df['5 highest absolute error'],
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['subgraph', 'node', '5 absolute error', 'max_error'])
+
+    results = pd.concat(frames, ignore_index=True)
+    # error rows such as "Model loading failed" become NaN and never count as positive
+    results['max_error'] = pd.to_numeric(results['5 absolute error'].astype(str).str.split(',').str[0], errors='coerce')
+    return results
+
+def load_store_results(directories):
+    """
+    Load the result stores of one or more run directories into one table.
+
+    Args:
+    directories (list): The run directories containing result_*.npz files.
+
+    Returns:
+    DataFrame: One row per node and run with the columns run, subgraph, node, status, max_error,
+    error_0 ... error_4, peak_memory (stores that record it) and a '<threshold> passed' and
+    '<threshold> match' column per threshold.
+    """
+    frames = []
+    for directory in directories:
+        for store_file in get_store_files(directory):
+            columns = result_store.load_result_store(os.path.join(directory, store_file))
+            frame = pd.DataFrame({
+                'run': columns['metadata'].get('run', os.path.basename(os.path.normpath(directory))),
+                'subgraph': columns['metadata'].get('source', store_file).replace("result_", ""),
+                'node': columns['node'],
+                'status': columns['status'],
+                'max_error': columns['top_errors'][:, 0] if columns['top_errors'].shape[1] else np.nan,
+            })
+            for i in range(columns['top_errors'].shape[1]):
+                frame[f'error_{i}'] = columns['top_errors'][:, i]
+            if 'peak_memory' in columns:
+                frame['peak_memory'] = columns['peak_memory']
+            for i, threshold in enumerate(columns['thresholds']):
+                frame[f'{threshold} passed'] = columns['passed'][:, i]
+                frame[f'{threshold} match'] = columns['match_percentage'][:, i]
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=['run', 'subgraph', 'node', 'status', 'max_error'])
+    return pd.concat(frames, ignore_index=True)
+
+def positive_error_nodes(results):
+    """
+    Get all nodes whose highest absolute error is positive.
+
+    Args:
+    results (DataFrame): The table from load_csv_results or load_store_results.
+
+    Returns:
+    DataFrame: The rows with a positive error, in their original order.
+    """
+    return results[results['max_error'] > 0.0]
+
+def highest_error_nodes(results, keys=('subgraph',)):
+    """
+    Get the node with the highest absolute error per group, the first one on ties.
+
+    Args:
+    results (DataFrame): The table from load_csv_results or load_store_results.
+    keys (tuple): The columns to group by, e.g. ('run', 'subgraph') across runs.
+
+    Returns:
+    DataFrame: One row per group that has a positive error.
+    """
+    positive = positive_error_nodes(results)
+    return positive.loc[positive.groupby(list(keys), sort=False)['max_error'].idxmax()]
+
 def analyze_subgraphs(directory):
     """
     Analyze subgraphs from CSV files in the specified directory.
-    
+
     Args:
     directory (str): The directory containing the CSV files.
     """
-    exclude_files = ['result_subgraphs.csv', 'subgraph_nodes_with_highest-abs-err.csv', 'subgraph_nodes_with_positive_abs_err.csv', '']  # Add more files to exclude if needed
-    csv_files = get_csv_files(directory, exclude_files)
-    subgraphs_with_highest_err_lst = []
-    subgraphs_lst = []
+    results = load_csv_results(directory)
+    positive = positive_error_nodes(results)
+    highest = highest_error_nodes(results)
 
-    for csv_file in csv_files:
-        print(f"Checking {csv_file} .....")
-        file_path = os.path.join(directory, csv_file)
-        df = pd.read_csv(file_path)
-
-        subgraph_with_highest_err = None
-        highest_error = 0.0
-        
-        # Get subgraph max absolute error column
-        sub_subgraphs, abs_errors = df['Subgraph'], df['5 highest absolute error']
-        
-        # Get subgraphs with positive absolute error at index 0
-        print("Subgraph nodes with positive absolute error")
-        for subgraph, abs_error in zip(sub_subgraphs, abs_errors):
-            try:
-                # Convert the absolute error to a list of floats
-                abs_error_list = [float(error) for error in abs_error.split(',')] if ',' in abs_error else [float(abs_error)]
-            except ValueError:
-                continue  # Skip this subgraph if abs_error is not a valid float
-        
-            if abs_error_list[0] > 0.0:
-                print([subgraph, abs_error])
-                subgraphs_lst.append([csv_file.replace("result_",""), subgraph, abs_error])
-                if highest_error < abs_error_list[0]:
-                    highest_error = abs_error_list[0]
-                    subgraph_with_highest_err = [subgraph, abs_error]
-                    
-        if subgraph_with_highest_err:
-            subgraphs_with_highest_err_lst.append([csv_file.replace("result_","")] + subgraph_with_highest_err)
+    print("Subgraph nodes with positive absolute error")
+    print(positive[['subgraph', 'node', '5 absolute error']].to_string(index=False))
 
     # Print the subgraph with the highest absolute error for each CSV file
-    print(f"\Subgraphs node with highest abs error")
-    for subgraph_with_high_err in subgraphs_with_highest_err_lst:
-        print(subgraph_with_high_err)
-        
+    print(f"\nSubgraphs node with highest abs error")
+    print(highest[['subgraph', 'node', '5 absolute error']].to_string(index=False))
+
     # Save the subgraph with the highest absolute error for each CSV file to a new CSV file
-    output_df = pd.DataFrame(subgraphs_with_highest_err_lst, columns=['subgraph', 'highest error node', '5 absolute error'])
+    output_df = highest[['subgraph', 'node', '5 absolute error']].rename(columns={'node': 'highest error node'})
     output_file_path = os.path.join(directory, 'subgraph_nodes_with_highest-abs-err.csv')
     output_df.to_csv(output_file_path, index=False)
     print(f"\nSubgraphs with highest errors saved to {output_file_path}")
-    
+
     # Save all subgraphs with positive absolute error to a new CSV file
-    subgraphs_output_df = pd.DataFrame(subgraphs_lst, columns=['subgraph', 'node', '5 absolute error'])
+    subgraphs_output_df = positive[['subgraph', 'node', '5 absolute error']]
     subgraphs_output_file_path = os.path.join(directory, 'subgraph_nodes_with_positive_abs_err.csv')
     subgraphs_output_df.to_csv(subgraphs_output_file_path, index=False)
     print(f"\nSubgraphs with positive absolute errors saved to {subgraphs_output_file_path}")
-     
-            
+
+def analyze_runs(directories, output_folder):
+    """
+    Analyze the result stores of several runs at once.
+
+    Args:
+    directories (list): The run directories containing result_*.npz files.
+    output_folder (str): The folder to write the analysis CSV files to.
+    """
+    results = load_store_results(directories)
+    keys = ['run', 'subgraph', 'node', 'max_error'] + [column for column in results.columns if column.endswith((' passed', ' match'))]
+
+    highest = highest_error_nodes(results, keys=('run', 'subgraph'))
+    output_file_path = os.path.join(output_folder, 'subgraph_nodes_with_highest-abs-err.csv')
+    highest[keys].to_csv(output_file_path, index=False)
+    print(f"Subgraphs with highest errors of {results['run'].nunique()} runs saved to {output_file_path}")
+
+    positive = positive_error_nodes(results)
+    output_file_path = os.path.join(output_folder, 'subgraph_nodes_with_positive_abs_err.csv')
+    positive[keys].to_csv(output_file_path, index=False)
+    print(f"{len(positive)} nodes with positive absolute errors saved to {output_file_path}")
+
+
 if __name__ == "__main__":
     directory = 'C:\\projects\\subgraph_accuracy_check\\results\\npu-subgraphs'
-    analyze_subgraphs(directory)
\ No newline at end of file
+    analyze_subgraphs(directory)
+    # analyze_runs(['C:\\projects\\subgraph_accuracy_check\\results\\run-1', 'C:\\projects\\subgraph_accuracy_check\\results\\run-2'], 'C:\\projects\\subgraph_accuracy_check\\results')
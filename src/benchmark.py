@@ -0,0 +1,285 @@
+# Benchmark of the slicing and checking pipeline on synthetic IR (see synthetic_ir.py):
+# parsing, node listing, cutting (graph index and legacy edit_xml.delLayers) and
+# end-to-end sweeps with CPU as both the reference and the target device. Prints the
+# scaling with the number of layers and compares against stored baseline numbers.
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import openvino as ov
+from lxml import objectify
+import accuracy_check
+import accuracy_check_for_subgraph
+import edit_xml
+import graph_index
+import synthetic_ir
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+# a regression is a stage that got this much slower than its baseline
+DEFAULT_THRESHOLD = 1.5
+# ... and by at least this many seconds, so sub-millisecond noise is not reported
+MIN_REGRESSION_SECONDS = 0.001
+
+
+def timed(func, repeat=1):
+    """
+    Time a function, best of repeat runs. Its prints are discarded.
+
+    Args:
+    func (callable): The function to time.
+    repeat (int): The number of runs.
+
+    Returns:
+    float: The best wall time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse(xml_path):
+    # cold parse: the index cache would turn every run after the first into a lookup
+    graph_index._load_graph_index.cache_clear()
+    return graph_index.load_graph_index(xml_path)
+
+
+def list_nodes(xml_path):
+    graph_index._load_graph_index.cache_clear()
+    return accuracy_check_for_subgraph.get_node_list(xml_path)
+
+
+def cut_nodes(xml_path, nodes):
+    for node in nodes:
+        accuracy_check_for_subgraph.delete_subgraph_files(accuracy_check_for_subgraph.create_new_subgraph(xml_path, node))
+
+
+def legacy_cut_nodes(xml_path, nodes):
+    for node in nodes:
+        edit_xml.delLayers(objectify.parse(str(xml_path)), node)
+
+
+def sweep(xml_path, output_folder, tol, dp):
+    accuracy_check_for_subgraph.accuracy_check_for_subgraph(str(xml_path.parent), str(xml_path.parent), [xml_path.name], output_folder, tol, dp, target_device="CPU")
+
+
+def window_sweep(xml_path, output_folder, tol, dp, depth=2):
+    accuracy_check_for_subgraph.accuracy_check_for_subgraph_windowed(str(xml_path.parent), str(xml_path.parent), [xml_path.name], output_folder, tol, dp, depth=depth, target_device="CPU")
+    # every node, the Result included, must get a real row from its window, not an error row
+    result_csv = os.path.join(output_folder, "result_" + xml_path.name.replace(".xml", f"_window{depth}.csv"))
+    with open(result_csv, newline='') as file:
+        failed = [row for row in list(csv.reader(file))[1:] if len(row) <= 2]
+    if failed:
+        raise Exception(f"Window sweep of {xml_path.name} failed for: " + ", ".join(f"{row[0]} ({row[1]})" for row in failed))
+
+
+def window_check(xml_path, depth=1):
+    # a window fed by the captured activations must reproduce the full model's activation at its node
+    core = ov.Core()
+    index = graph_index.load_graph_index(xml_path)
+    nodes = accuracy_check_for_subgraph.get_node_list(xml_path)
+    outputs = {}
+    for node in nodes:
+        layer_id, output_port, _ = index.cut_point(index.get_layer(node))
+        outputs[node] = (index.layers[layer_id].get("name"), index.output_index(layer_id, output_port.get("id")))
+    tensors = list(dict.fromkeys([tensor for node in nodes for tensor in index.window_inputs(node, depth)] + list(outputs.values())))
+    activations = accuracy_check_for_subgraph.capture_activations(core, str(xml_path), tensors)
+
+    weights = accuracy_check_for_subgraph.load_weights(xml_path)
+    mismatched = []
+    for node in nodes:
+        compiled_model = accuracy_check.load_model(core, accuracy_check_for_subgraph.create_new_subgraph_in_memory(core, xml_path, node, weights, depth), "CPU")
+        input_data = accuracy_check.named_input_data(compiled_model.inputs, activations) if compiled_model else None
+        result = accuracy_check.perform_inference(compiled_model, input_data) if input_data is not None else None
+        expected = activations.get(graph_index.boundary_tensor_name(*outputs[node]))
+        if result is None or expected is None or not np.allclose(result[0], expected, rtol=1e-3, atol=1e-5):
+            mismatched.append(node)
+    if mismatched:
+        raise Exception(f"Depth {depth} windows of {xml_path.name} do not reproduce the full model at: " + ", ".join(mismatched))
+
+
+def sample_nodes(nodes, count=3):
+    # early, middle and last node: the cone (and the cut) grows with the position
+    positions = np.linspace(0, len(nodes) - 1, num=min(count, len(nodes))).astype(int)
+    return [nodes[i] for i in positions]
+
+
+def benchmark_model(xml_path, output_folder, repeat=3, legacy_max_layers=10000, sweep_max_layers=100, tol=[0.01], dp=[4]):
+    """
+    Time every stage on one model.
+
+    Args:
+    xml_path (Path): The synthetic IR.
+    output_folder (str): The folder for the sweep results.
+    repeat (int): The number of runs per stage, the best one is kept.
+    legacy_max_layers (int): Skip the legacy cut above this size.
+    sweep_max_layers (int): Skip the end-to-end sweep above this size.
+    tol (list): The tolerances of the sweep.
+    dp (list): The decimal places of the sweep.
+
+    Returns:
+    tuple: The number of layers and the wall time in seconds per stage (cut times are per node).
+    """
+    num_layers = len(parse(xml_path).layer_ids)
+    nodes = accuracy_check_for_subgraph.get_node_list(xml_path)
+    cut_sample = sample_nodes(nodes)
+
+    times = {
+        "parse": timed(lambda: parse(xml_path), repeat),
+        "node_list": timed(lambda: list_nodes(xml_path), repeat),
+        "cut": timed(lambda: cut_nodes(xml_path, cut_sample), repeat) / len(cut_sample),
+    }
+    if num_layers <= legacy_max_layers:
+        times["legacy_cut"] = timed(lambda: legacy_cut_nodes(xml_path, cut_sample), repeat) / len(cut_sample)
+    if num_layers <= sweep_max_layers:
+        # one sweep compiles and runs every node, repeating it would only repeat the same work
+        times["sweep"] = timed(lambda: sweep(xml_path, output_folder, tol, dp))
+        times["sweep_per_node"] = times["sweep"] / len(nodes)
+        times["window_sweep"] = timed(lambda: window_sweep(xml_path, output_folder, tol, dp))
+        times["window_check"] = timed(lambda: window_check(xml_path))
+    return num_layers, times
+
+
+def run_benchmarks(output_folder, sizes=DEFAULT_SIZES, topologies=synthetic_ir.TOPOLOGIES, repeat=3, legacy_max_layers=10000, sweep_max_layers=100):
+    """
+    Generate synthetic IR of every topology and size and benchmark it.
+
+    Args:
+    output_folder (str): The folder for the models and results.
+    sizes (list): The approximate numbers of layers.
+    topologies (list): The topologies to generate.
+    repeat (int): The number of runs per stage.
+    legacy_max_layers (int): Skip the legacy cut above this size.
+    sweep_max_layers (int): Skip the end-to-end sweep above this size.
+
+    Returns:
+    list: One dict per (topology, size, stage) with the wall time in seconds.
+    """
+    model_folder = Path(output_folder) / "models"
+    results = []
+    for topology in topologies:
+        for size in sizes:
+            xml_path = model_folder / f"{topology}_{size}.xml"
+            if not xml_path.is_file():
+                synthetic_ir.generate_ir(xml_path, topology, size)
+
+            num_layers, times = benchmark_model(xml_path, output_folder, repeat, legacy_max_layers, sweep_max_layers)
+            for stage, seconds in times.items():
+                print(f"{topology:<10}{num_layers:>8} layers  {stage:<16}{seconds * 1000:>12.3f} ms")
+                results.append({"topology": topology, "size": size, "layers": num_layers, "stage": stage, "seconds": seconds})
+    return results
+
+
+def print_scaling(results):
+    # time per size for every (topology, stage) and the fitted exponent: ~1 is linear, ~2 quadratic
+    sizes = sorted({result["size"] for result in results})
+    print(f"\n{'topology':<10}{'stage':<16}" + "".join(f"{size:>12}" for size in sizes) + f"{'exponent':>10}")
+    groups = {}
+    for result in results:
+        groups.setdefault((result["topology"], result["stage"]), {})[result["size"]] = result
+    for (topology, stage), by_size in groups.items():
+        cells = "".join(f"{by_size[size]['seconds'] * 1000:>10.2f}ms" if size in by_size else f"{'-':>12}" for size in sizes)
+        exponent = ""
+        if len(by_size) > 1:
+            layers = [result["layers"] for result in by_size.values()]
+            seconds = [max(result["seconds"], 1e-9) for result in by_size.values()]
+            exponent = f"{np.polyfit(np.log(layers), np.log(seconds), 1)[0]:.2f}"
+        print(f"{topology:<10}{stage:<16}{cells}{exponent:>10}")
+
+
+def write_results(results, output_csv_filepath):
+    with open(output_csv_filepath, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=["topology", "size", "layers", "stage", "seconds"])
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Benchmark results saved to {output_csv_filepath}")
+
+
+def result_key(result):
+    return f"{result['topology']}/{result['size']}/{result['stage']}"
+
+
+def save_baseline(results, baseline_path):
+    baseline = {
+        "openvino": ov.get_version(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.time(),
+        "results": {result_key(result): result["seconds"] for result in results},
+    }
+    with open(baseline_path, 'w') as file:
+        json.dump(baseline, file, indent=2)
+    print(f"Baseline saved to {baseline_path}")
+
+
+def compare_baseline(results, baseline_path, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results against a stored baseline.
+
+    Args:
+    results (list): The benchmark results.
+    baseline_path (str): The baseline JSON file.
+    threshold (float): The slowdown ratio reported as a regression.
+
+    Returns:
+    list: The regressions as (key, baseline seconds, current seconds).
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+
+    if baseline.get("openvino") != ov.get_version():
+        print(f"Baseline was recorded with OpenVINO {baseline.get('openvino')}, running {ov.get_version()}")
+
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in baseline["results"]:
+            continue
+        ratio = result["seconds"] / max(baseline["results"][key], 1e-9)
+        if ratio > threshold and result["seconds"] - baseline["results"][key] > MIN_REGRESSION_SECONDS:
+            regressions.append((key, baseline["results"][key], result["seconds"]))
+            print(f"Regression {key}: {baseline['results'][key] * 1000:.3f} ms -> {result['seconds'] * 1000:.3f} ms ({ratio:.2f}x)")
+
+    if not regressions:
+        print(f"No regressions above {threshold}x against {baseline_path}")
+    return regressions
+
+
+if __name__ == "__main__":
+    # Examples:
+    # python benchmark.py --output-folder bench --save-baseline bench/baseline.json
+    # python benchmark.py --output-folder bench --baseline bench/baseline.json
+    # python benchmark.py --sizes 10,100,1000,10000,100000 --topologies chain,attention --legacy-max-layers 1000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-folder", default="benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--topologies", default=",".join(synthetic_ir.TOPOLOGIES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max-layers", type=int, default=10000)
+    parser.add_argument("--sweep-max-layers", type=int, default=100)
+    parser.add_argument("--save-baseline")
+    # timings are per machine, a baseline is only compared against when given
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    results = run_benchmarks(args.output_folder, [int(size) for size in args.sizes.split(",")], args.topologies.split(","), args.repeat, args.legacy_max_layers, args.sweep_max_layers)
+    print_scaling(results)
+    write_results(results, os.path.join(args.output_folder, "benchmark_results.csv"))
+
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    if args.baseline and compare_baseline(results, args.baseline, args.threshold):
+        sys.exit(1)
@@ -42,10 +42,10 @@ def changeEdges(edges, legimate_paths, layerid, resultid):
             continue
 
         # cases for delete
-        if current_id < layerid:
+        if int(current_id) < int(layerid):
             paths.add(current_id)
 
-        if parent_id not in legimate_paths and parent_id < layerid:
+        if parent_id not in legimate_paths and int(parent_id) < int(layerid):
             paths.add(parent_id)
         edges.remove(sibling)
 
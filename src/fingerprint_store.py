@@ -0,0 +1,61 @@
+# Result rows of one subgraph together with the structural fingerprint of every node's
+# ancestor cone (see GraphIndex.fingerprints), stored next to the results. A later run
+# only re-checks nodes whose fingerprint changed and copies the previous rows forward.
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import result_store
+
+
+def node_fingerprint(fingerprint_cpu, fingerprint_npu, config):
+    # a row is only valid for the same CPU cone, target cone and thresholds
+    return hashlib.sha256(f"{fingerprint_cpu}|{fingerprint_npu}|{config}".encode()).hexdigest()
+
+
+class FingerprintStore:
+    """
+    Fingerprinted result rows of one subgraph, keyed by node.
+
+    Args:
+    path (str): The JSON file of the subgraph.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        """
+        Read the rows of the previous run.
+
+        Returns:
+        dict: (fingerprint, row) keyed by node, empty when there was no previous run.
+        """
+        if not self.path.is_file():
+            return {}
+
+        try:
+            with open(self.path) as file:
+                nodes = json.load(file)["nodes"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Cannot load fingerprints {self.path}: {str(e)}")
+            return {}
+
+        return {node: (entry["fingerprint"], result_store.ResultRow(entry["row"], entry.get("metrics"))) for node, entry in nodes.items()}
+
+    def save(self, entries):
+        """
+        Write the rows of this run.
+
+        Args:
+        entries (dict): (fingerprint, row) keyed by node.
+        """
+        nodes = {
+            node: {"fingerprint": fingerprint, "row": [str(value) for value in row], "metrics": getattr(row, "metrics", None)}
+            for node, (fingerprint, row) in entries.items()
+        }
+        temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w') as file:
+            json.dump({"nodes": nodes}, file)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,412 @@
+import hashlib
+from collections import deque
+from copy import deepcopy
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from lxml import etree, objectify
+import profiling
+
+# IR port precisions to Parameter element types
+ELEMENT_TYPES = {
+    "FP64": "f64", "FP32": "f32", "FP16": "f16", "BF16": "bf16",
+    "I64": "i64", "I32": "i32", "I16": "i16", "I8": "i8", "I4": "i4",
+    "U64": "u64", "U32": "u32", "U16": "u16", "U8": "u8", "U4": "u4", "U1": "u1",
+    "BOOL": "boolean",
+}
+
+
+def boundary_tensor_name(producer_name, output_index):
+    # name of the Parameter (and of its tensor) that replaces an upstream output in a window
+    return f"{producer_name}:{output_index}"
+
+
+class GraphIndex:
+    """
+    Index of an OpenVINO IR built from a single parse.
+
+    Layers are looked up by id or name, edges are kept as forward and reverse
+    adjacency lists and the topological order is computed once, so cutting the
+    graph at a node only touches that node's ancestor cone.
+
+    Args:
+    tree (ElementTree): The parsed model IR.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.root = tree.getroot()
+
+        layers = self.root.find("layers")
+        if layers is None:
+            raise Exception("Cannot find layers in IR")
+
+        edges = self.root.find("edges")
+        if edges is None:
+            raise Exception("Cannot find edges in IR")
+
+        self.layers = {}
+        self.layer_ids = []
+        self.ids_by_name = {}
+        self.position = {}
+        for layer in layers.iterchildren("layer"):
+            layer_id = layer.get("id")
+            self.position[layer_id] = len(self.layer_ids)
+            self.layers[layer_id] = layer
+            self.layer_ids.append(layer_id)
+            self.ids_by_name.setdefault(layer.get("name"), layer_id)
+
+        # edges are kept in IR order so the emitted cut keeps the original edge order
+        self.edges = list(edges.iterchildren("edge"))
+        self.successors = {layer_id: [] for layer_id in self.layer_ids}
+        self.predecessors = {layer_id: [] for layer_id in self.layer_ids}
+        for edge_index, edge in enumerate(self.edges):
+            self.successors[edge.get("from-layer")].append(edge_index)
+            self.predecessors[edge.get("to-layer")].append(edge_index)
+
+        self.topological_order = self._topological_order()
+        # the Result a cut is fed into, looked up once instead of on every cut
+        self.result_id = next((layer_id for layer_id in self.layer_ids if self.layers[layer_id].get("type") == "Result"), None)
+        self._constant_layers = None
+        self._fingerprints = {}
+        # new layers (window Parameters) get ids after every existing one
+        self.max_id = max((int(layer_id) for layer_id in self.layer_ids), default=-1)
+
+    def _topological_order(self):
+        # Kahn's algorithm, ties broken by document order
+        in_degree = {layer_id: len(self.predecessors[layer_id]) for layer_id in self.layer_ids}
+        ready = deque(layer_id for layer_id in self.layer_ids if in_degree[layer_id] == 0)
+
+        order = []
+        while ready:
+            layer_id = ready.popleft()
+            order.append(layer_id)
+            for edge_index in self.successors[layer_id]:
+                successor = self.edges[edge_index].get("to-layer")
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    ready.append(successor)
+
+        if len(order) != len(self.layer_ids):
+            raise Exception("Cannot sort IR layers: graph has a cycle")
+
+        return order
+
+    def layer_names(self):
+        return [self.layers[layer_id].get("name") for layer_id in self.layer_ids]
+
+    def topological_names(self):
+        return [self.layers[layer_id].get("name") for layer_id in self.topological_order]
+
+    def get_layer(self, layername):
+        layer_id = self.ids_by_name.get(layername)
+        if layer_id is None:
+            raise Exception('''Cannot find layer by name {0}'''.format(layername))
+        return self.layers[layer_id]
+
+    def ancestors(self, layer_id):
+        # reverse traversal from the layer: the layer itself and everything it depends on
+        cone = {layer_id}
+        pending = [layer_id]
+        while pending:
+            for edge_index in self.predecessors[pending.pop()]:
+                parent_id = self.edges[edge_index].get("from-layer")
+                if parent_id not in cone:
+                    cone.add(parent_id)
+                    pending.append(parent_id)
+        return cone
+
+    def constant_layers(self):
+        # layers that do not depend on any input: Const and everything computed only from Consts
+        if self._constant_layers is None:
+            constant = set()
+            for layer_id in self.topological_order:
+                layer_type = self.layers[layer_id].get("type")
+                parents = [self.edges[edge_index].get("from-layer") for edge_index in self.predecessors[layer_id]]
+                if layer_type == "Const" or (parents and layer_type != "Parameter" and all(parent in constant for parent in parents)):
+                    constant.add(layer_id)
+            self._constant_layers = constant
+        return self._constant_layers
+
+    def fingerprints(self, bin_path=None):
+        """
+        Compute a structural fingerprint of every layer's ancestor cone.
+
+        Each layer hashes its type, version, attributes, output shapes and precisions and,
+        for a Const, the bytes of its weight range in the .bin (not the offset, so moving
+        weights around does not matter), together with the fingerprints of its inputs in
+        port order. Layer names and ids are left out, so only structural changes count.
+
+        Args:
+        bin_path (str): The weights of the IR, None to leave weight contents out.
+
+        Returns:
+        dict: The hex fingerprint of every layer keyed by layer name.
+        """
+        stat = Path(bin_path).stat() if bin_path and Path(bin_path).is_file() else None
+        key = (str(bin_path), stat.st_mtime_ns, stat.st_size) if stat else None
+        if key in self._fingerprints:
+            return self._fingerprints[key]
+
+        weights = np.memmap(str(bin_path), dtype=np.uint8, mode='r') if stat and stat.st_size else None
+        fingerprints = {}
+        for layer_id in self.topological_order:
+            layer = self.layers[layer_id]
+            digest = hashlib.sha256(f"{layer.get('type')}|{layer.get('version')}".encode())
+
+            data = layer.find("data")
+            if data is not None:
+                for name, value in sorted(data.attrib.items()):
+                    if name not in ("offset", "size"):
+                        digest.update(f"|{name}={value}".encode())
+                if weights is not None and data.get("offset") is not None and data.get("size") is not None:
+                    offset = int(data.get("offset"))
+                    digest.update(hashlib.sha256(weights[offset:offset + int(data.get("size"))]).digest())
+
+            output = layer.find("output")
+            if output is not None:
+                for port in output.iterchildren("port"):
+                    digest.update(f"|{port.get('precision')}[{','.join(str(dim) for dim in port.iterchildren('dim'))}]".encode())
+
+            # the inputs in port order, each with the output it reads: a Merkle hash of the cone
+            for edge_index in sorted(self.predecessors[layer_id], key=lambda edge_index: int(self.edges[edge_index].get("to-port"))):
+                edge = self.edges[edge_index]
+                parent_id = edge.get("from-layer")
+                digest.update(f"|{edge.get('to-port')}<{self.output_index(parent_id, edge.get('from-port'))}:{fingerprints[parent_id]}".encode())
+
+            fingerprints[layer_id] = digest.hexdigest()
+
+        by_name = {self.layers[layer_id].get("name"): fingerprints[layer_id] for layer_id in self.layer_ids}
+        self._fingerprints[key] = by_name
+        return by_name
+
+    def window(self, layer_id, depth):
+        # the layer and its non-constant ancestors less than depth edges away; constant
+        # producers are kept whole since they need no input, original Parameters never are
+        constant = self.constant_layers()
+        kept = {layer_id}
+        frontier = [layer_id]
+        for distance in range(depth):
+            next_frontier = []
+            for current in frontier:
+                for edge_index in self.predecessors[current]:
+                    parent_id = self.edges[edge_index].get("from-layer")
+                    if parent_id in kept:
+                        continue
+                    if parent_id in constant:
+                        kept |= self.ancestors(parent_id)
+                    elif distance + 1 < depth and self.layers[parent_id].get("type") != "Parameter":
+                        kept.add(parent_id)
+                        next_frontier.append(parent_id)
+            frontier = next_frontier
+        return kept
+
+    def cut_point(self, layer):
+        """
+        Get the output a cut at a layer feeds into the Result: the first output port of the
+        layer, or for a Result the output of its producer, so a Result is cut like any other
+        layer instead of copying the whole model.
+
+        Args:
+        layer (Element): The layer to cut at.
+
+        Returns:
+        tuple: The (layer id, output port element, Result element) of the cut.
+        """
+        if layer.get("type") == "Result":
+            if not self.predecessors[layer.get("id")]:
+                raise Exception('''Cannot find input for Result id: {0}'''.format(layer.get("id")))
+            edge = self.edges[self.predecessors[layer.get("id")][0]]
+            producer_id = edge.get("from-layer")
+            output_port = next(port for port in self.layers[producer_id].find("output").iterchildren("port") if port.get("id") == edge.get("from-port"))
+            return producer_id, output_port, layer
+
+        output = layer.find("output")
+        # there must be at least 1 output
+        if output is None:
+            raise Exception('''Cannot find output for layer: {0}'''.format(layer.get("name")))
+
+        # the first output port feeds the Result, as in edit_xml.delLayers
+        output_port = output.find("port")
+        if output_port is None:
+            raise Exception('''Cannot find output port for layer: {0}'''.format(layer.get("name")))
+
+        if self.result_id is None:
+            raise Exception("Cannot find result layer")
+        return layer.get("id"), output_port, self.layers[self.result_id]
+
+    def output_index(self, layer_id, port_id):
+        ports = [port.get("id") for port in self.layers[layer_id].find("output").iterchildren("port")]
+        return ports.index(port_id)
+
+    def window_inputs(self, layername, depth):
+        """
+        Get the upstream tensors a window reads, i.e. the Parameters of cut(layername, depth).
+
+        Args:
+        layername (str): The name of the layer to cut at.
+        depth (int): The number of non-constant layers in the window along any path.
+
+        Returns:
+        list: The (producer name, output index) of every boundary tensor.
+        """
+        # a Result is windowed at its producer, as in cut
+        layer_id = self.cut_point(self.get_layer(layername))[0]
+        layer = self.layers[layer_id]
+        if layer.get("type") == "Parameter":
+            return [(layer.get("name"), 0)]
+
+        kept = self.window(layer_id, depth)
+        tensors = []
+        for edge_index in self._edges_into(kept):
+            edge = self.edges[edge_index]
+            if edge.get("from-layer") not in kept:
+                producer_id = edge.get("from-layer")
+                tensor = (self.layers[producer_id].get("name"), self.output_index(producer_id, edge.get("from-port")))
+                if tensor not in tensors:
+                    tensors.append(tensor)
+        return tensors
+
+    def _edges_into(self, kept):
+        # every edge ending in the kept layers, in IR order
+        return sorted(edge_index for kept_id in kept for edge_index in self.predecessors[kept_id])
+
+    def _boundary_parameter(self, parent, new_id, producer_id, port_id):
+        # a Parameter with the shape and precision of the upstream output it replaces
+        output_port = next(port for port in self.layers[producer_id].find("output").iterchildren("port") if port.get("id") == port_id)
+        name = boundary_tensor_name(self.layers[producer_id].get("name"), self.output_index(producer_id, port_id))
+        precision = output_port.get("precision", "FP32")
+        dims = [deepcopy(dim) for dim in output_port.iterchildren("dim")]
+
+        parameter = parent.makeelement("layer", {"id": new_id, "name": name, "type": "Parameter", "version": "opset1"})
+        parameter.append(parameter.makeelement("data", {
+            "shape": ",".join("?" if str(dim.text) == "-1" else str(dim.text) for dim in dims),
+            "element_type": ELEMENT_TYPES.get(precision, precision.lower()),
+        }))
+        output = parameter.makeelement("output", {})
+        port = output.makeelement("port", {"id": "0", "precision": precision, "names": name})
+        port.extend(dims)
+        output.append(port)
+        parameter.append(output)
+        return parameter
+
+    def cut(self, layername, depth=None):
+        """
+        Build a new IR whose only Result is fed by the first output of the layer.
+
+        Equivalent to edit_xml.delLayers on a fresh parse, but only the ancestor
+        cone of the layer is copied and the indexed tree is left untouched.
+        With a depth only a window of the cone is kept and every upstream tensor
+        feeding the window becomes a Parameter named by boundary_tensor_name.
+
+        Args:
+        layername (str): The name of the layer to cut at.
+        depth (int): The number of non-constant layers in the window along any path, None for the whole cone.
+
+        Returns:
+        ElementTree: The pruned model IR.
+        """
+        cut_at_result = self.get_layer(layername).get("type") == "Result"
+        layer_id, output_port, result = self.cut_point(self.get_layer(layername))
+        layer = self.layers[layer_id]
+
+        result_input = result.find("input")
+        if result_input is None:
+            raise Exception('''Cannot find input for Result id: {0}'''.format(result.get("id")))
+
+        result_input_port = result_input.find("port")
+        if result_input_port is None:
+            raise Exception('''Cannot find input port for Result id: {0} '''.format(result.get("id")))
+
+        kept = self.ancestors(layer_id) if depth is None else self.window(layer_id, depth)
+        kept_ids = sorted(kept, key=self.position.get)
+        # the cone is closed under predecessors, a window is not: its other inputs come from boundary Parameters
+        edge_indices = self._edges_into(kept)
+        boundary = {}
+        next_id = self.max_id + 1
+        for edge_index in edge_indices:
+            source = (self.edges[edge_index].get("from-layer"), self.edges[edge_index].get("from-port"))
+            if source[0] not in kept and source not in boundary:
+                boundary[source] = str(next_id)
+                next_id += 1
+
+        new_root = self.root.makeelement(self.root.tag, self.root.attrib)
+        for child in self.root.iterchildren():
+            if child.tag == "layers":
+                new_layers = new_root.makeelement("layers", child.attrib)
+                for source, parameter_id in boundary.items():
+                    new_layers.append(self._boundary_parameter(new_layers, parameter_id, *source))
+                for kept_id in kept_ids:
+                    new_kept_layer = deepcopy(self.layers[kept_id])
+                    new_layers.append(new_kept_layer)
+                    if kept_id == layer_id:
+                        new_layer = new_kept_layer
+                new_result = deepcopy(result)
+                new_layers.append(new_result)
+                new_root.append(new_layers)
+            elif child.tag == "edges":
+                new_edges = new_root.makeelement("edges", child.attrib)
+                for edge_index in edge_indices:
+                    edge = self.edges[edge_index]
+                    source = (edge.get("from-layer"), edge.get("from-port"))
+                    if source in boundary:
+                        new_edges.append(new_edges.makeelement("edge", {
+                            "from-layer": boundary[source],
+                            "from-port": "0",
+                            "to-layer": edge.get("to-layer"),
+                            "to-port": edge.get("to-port"),
+                        }))
+                    else:
+                        new_edges.append(deepcopy(edge))
+                new_edges.append(new_edges.makeelement("edge", {
+                    "from-layer": layer_id,
+                    "from-port": output_port.get("id"),
+                    "to-layer": result.get("id"),
+                    "to-port": result_input_port.get("id"),
+                }))
+                new_root.append(new_edges)
+            else:
+                new_root.append(deepcopy(child))
+
+        # override dims for new Result by actual Layer dims
+        new_result_port = new_result.find("input").find("port")
+        for dim in list(new_result_port.iterchildren("dim")):
+            new_result_port.remove(dim)
+        for dim in output_port.iterchildren("dim"):
+            new_result_port.append(deepcopy(dim))
+
+        # OpenVINO fix: set attribute `names` forcibly for the output that now feeds the Result;
+        # a Parameter keeps a tensor name it can be fed by instead, and the output of a Result
+        # cut keeps the names it had in the model
+        new_port = next(port for port in new_layer.find("output").iterchildren("port") if port.get("id") == output_port.get("id"))
+        if layer.get("type") == "Parameter" and depth is not None:
+            new_port.set("names", boundary_tensor_name(layer.get("name"), 0))
+        elif (layer.get("type") != "Parameter" and not cut_at_result) or not new_port.get("names"):
+            new_port.set("names", result.get("name"))
+
+        return etree.ElementTree(new_root)
+
+
+@lru_cache(maxsize=8)
+def _load_graph_index(modelpath, mtime_ns, size):
+    with profiling.stage("parse", bytes_read=size):
+        parser = objectify.makeparser(remove_comments=True)
+        tree = objectify.parse(modelpath, parser=parser)
+        if tree is None:
+            raise Exception("Cannot parse model IR")
+        return GraphIndex(tree)
+
+
+def load_graph_index(modelpath):
+    """
+    Parse the model IR once and reuse the index until the file changes.
+
+    Args:
+    modelpath (str): The path to the model IR (.xml).
+
+    Returns:
+    GraphIndex: The index of the model IR.
+    """
+    modelpath = Path(modelpath).resolve()
+    stat = modelpath.stat()
+    return _load_graph_index(str(modelpath), stat.st_mtime_ns, stat.st_size)
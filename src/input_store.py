@@ -0,0 +1,170 @@
+# Capture and replay of real subgraph inputs. The full model is run once per sample (e.g.
+# tokenized prompts) with the input tensors of every OpenVINO-EP subgraph tapped, and each
+# subgraph's inputs are saved as .npy files. On replay the files are memory-mapped one
+# sample at a time and fed to the infer request by name without copying.
+
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import openvino as ov
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANIFEST = "manifest.json"
+
+
+class InputStore:
+    """
+    Recorded inputs of subgraphs, one folder per subgraph and sample.
+
+    Args:
+    store_dir (str): The directory of the store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def sample_dir(self, subgraph_file, sample_index):
+        return self.store_dir / Path(subgraph_file).stem / f"sample_{sample_index}"
+
+    def save(self, subgraph_file, sample_index, inputs):
+        """
+        Save the inputs of one sample of a subgraph.
+
+        Args:
+        subgraph_file (str): The subgraph IR file name.
+        sample_index (int): The index of the sample.
+        inputs (dict): The input arrays keyed by tensor name.
+        """
+        sample_dir = self.sample_dir(subgraph_file, sample_index)
+        temp_dir = sample_dir.with_name(f"{sample_dir.name}.{os.getpid()}.tmp")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        temp_dir.mkdir(parents=True)
+
+        # tensor names may contain '/' or ':', the manifest maps them to the files
+        manifest = {"inputs": []}
+        for i, (name, array) in enumerate(inputs.items()):
+            file_name = f"input_{i}.npy"
+            np.save(temp_dir / file_name, np.ascontiguousarray(array))
+            manifest["inputs"].append({"name": name, "file": file_name})
+        with open(temp_dir / MANIFEST, 'w') as file:
+            json.dump(manifest, file)
+
+        shutil.rmtree(sample_dir, ignore_errors=True)
+        os.replace(temp_dir, sample_dir)
+
+    def sample_indices(self, subgraph_file):
+        subgraph_dir = self.store_dir / Path(subgraph_file).stem
+        if not subgraph_dir.is_dir():
+            return []
+        return sorted(
+            int(sample_dir.name.split("_")[1])
+            for sample_dir in subgraph_dir.iterdir()
+            if sample_dir.suffix != ".tmp" and (sample_dir / MANIFEST).is_file()
+        )
+
+    def load(self, subgraph_file, sample_index):
+        # copy-on-write maps: OpenVINO only shares writable buffers, and the files stay untouched
+        sample_dir = self.sample_dir(subgraph_file, sample_index)
+        with open(sample_dir / MANIFEST) as file:
+            manifest = json.load(file)
+        return {entry["name"]: np.load(sample_dir / entry["file"], mmap_mode='c') for entry in manifest["inputs"]}
+
+    def samples(self, subgraph_file):
+        """
+        Iterate the recorded samples of a subgraph lazily, only one sample is mapped at a time.
+
+        Args:
+        subgraph_file (str): The subgraph IR file name.
+
+        Returns:
+        generator: (sample index, input arrays keyed by tensor name) per sample.
+        """
+        for sample_index in self.sample_indices(subgraph_file):
+            yield sample_index, self.load(subgraph_file, sample_index)
+
+
+def load_samples(sample_folder):
+    """
+    Iterate the model inputs of every sample lazily, one .npz per sample (e.g. a tokenized
+    prompt saved with np.savez(path, input_ids=..., attention_mask=..., position_ids=...)).
+
+    Args:
+    sample_folder (str): The folder of .npz files, read in name order.
+
+    Returns:
+    generator: The input arrays of each sample keyed by input name.
+    """
+    for sample_file in sorted(Path(sample_folder).glob("*.npz")):
+        with np.load(sample_file) as sample:
+            yield {name: sample[name] for name in sample.files}
+
+
+def capture_inputs(core, model_path, subgraph_folder, subgraph_files, samples, input_store):
+    """
+    Run the full model on every sample and record the inputs of each subgraph. The subgraph
+    inputs are found in the full model by tensor name.
+
+    Args:
+    core (Core): The OpenVINO core.
+    model_path (str): The full model (IR or ONNX).
+    subgraph_folder (str): The folder of the subgraph IRs.
+    subgraph_files (list): The subgraph IR file names.
+    samples (iterable): The full model inputs of each sample, keyed by input name.
+    input_store (InputStore): The store to record to.
+
+    Returns:
+    int: The number of samples captured.
+    """
+    model = core.read_model(model_path)
+    model_inputs = {name for model_input in model.inputs for name in model_input.get_names()}
+    tensors = {name: output for op in model.get_ops() for output in op.outputs() for name in output.get_names()}
+
+    subgraph_inputs = {}
+    tapped = {}
+    for subgraph_file in subgraph_files:
+        names = [subgraph_input.get_any_name() for subgraph_input in core.read_model(os.path.join(subgraph_folder, subgraph_file)).inputs]
+        missing = [name for name in names if name not in tensors]
+        if missing:
+            print(f"Skipping {subgraph_file}, inputs not found in full model: {', '.join(missing)}")
+            continue
+        subgraph_inputs[subgraph_file] = names
+        # inputs of the full model come straight from the sample, everything else is tapped
+        tapped.update({name: tensors[name] for name in names if name not in model_inputs})
+
+    tapped_names = list(tapped)
+    if tapped_names:
+        model.add_outputs([tapped[name] for name in tapped_names])
+    result_index = {name: model.get_result_index(tapped[name]) for name in tapped_names}
+
+    compiled_model = core.compile_model(model, "CPU")
+    infer_request = compiled_model.create_infer_request()
+
+    count = 0
+    for sample_index, sample in enumerate(samples):
+        print(f"Capturing sample {sample_index}...")
+        infer_request.infer(sample)
+        for subgraph_file, names in subgraph_inputs.items():
+            inputs = {
+                name: sample[name] if name in model_inputs else infer_request.get_output_tensor(result_index[name]).data
+                for name in names
+            }
+            input_store.save(subgraph_file, sample_index, inputs)
+        count += 1
+
+    print(f"Captured {count} samples of {len(subgraph_inputs)} subgraphs to {input_store.store_dir}")
+    return count
+
+
+if __name__ == "__main__":
+    # Example (.env):
+    # FULL_MODEL=C:\projects\phi3\model.onnx
+    # SAMPLE_FOLDER=C:\projects\phi3\samples
+    # INPUT_STORE_DIR=C:\projects\subgraph_accuracy_check\inputs
+    subgraph_folder_npu = os.getenv('NPU_SUBGRAPH_FOLDER')
+    subgraph_files = sorted(f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml'))
+    capture_inputs(ov.Core(), os.getenv('FULL_MODEL'), subgraph_folder_npu, subgraph_files, load_samples(os.getenv('SAMPLE_FOLDER')), InputStore(os.getenv('INPUT_STORE_DIR')))
@@ -0,0 +1,55 @@
+# Append-only journal of result rows. Every row is flushed to disk as soon as it is
+# checked, so an interrupted sweep can be resumed without checking the same
+# (subgraph, node, config) again.
+
+import json
+import os
+from pathlib import Path
+import result_store
+
+
+def config_key(tol, dp):
+    return json.dumps({"tol": list(tol), "dp": list(dp)}, sort_keys=True)
+
+
+class ResultJournal:
+    """
+    Journal of result rows keyed by (subgraph, node, config).
+
+    Args:
+    path (str): The journal file (JSON lines).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        """
+        Read the rows checked so far. Later entries win over earlier ones and a
+        line truncated by a crash is ignored.
+
+        Returns:
+        dict: The result rows keyed by (subgraph, node, config).
+        """
+        done = {}
+        if not self.path.is_file():
+            return done
+
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                    done[(entry["subgraph"], entry["node"], entry["config"])] = result_store.ResultRow(entry["row"], entry.get("metrics"))
+                except (ValueError, KeyError):
+                    continue
+
+        print(f"Loaded {len(done)} journaled results from {self.path}")
+        return done
+
+    def append(self, subgraph, node, config, row):
+        # the numeric metrics are journaled too, so resumed rows keep full precision in the result store
+        entry = {"subgraph": subgraph, "node": node, "config": config, "row": [str(value) for value in row], "metrics": getattr(row, "metrics", None)}
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
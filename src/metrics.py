@@ -0,0 +1,287 @@
+# Single-pass comparison metrics: the absolute difference of every output is computed
+# once per chunk and all tolerance / decimal-place thresholds and the top-k errors are
+# evaluated from it, so memory stays bounded by the chunk size instead of the tensor size.
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# smallest chunk a memory budget is split into, below this the per-chunk overhead dominates
+MIN_CHUNK_SIZE = 1 << 12
+# triage compares in smaller chunks, so a failure is found after reading little of the output
+TRIAGE_CHUNK_SIZE = 1 << 16
+# fixed workspace of a comparison besides the chunk arrays (top-k, histogram, numpy scratch)
+WORKSPACE_OVERHEAD = 64 * 1024
+# relative tolerance used by np.isclose, kept so tolerance results do not change
+RTOL = 1e-05
+# log-spaced histogram of absolute errors from 1e-12 to 1e6, 50 bins per decade (percentiles within ~5%)
+HISTOGRAM_EDGES = np.logspace(-12, 6, 18 * 50 + 1)
+
+
+class ComparisonMetrics:
+    """
+    Accumulate comparison metrics over CPU/NPU output pairs.
+
+    Args:
+    tol (list): The absolute tolerances to check.
+    dp (list): The decimal places to check.
+    top_k (int): The number of highest absolute errors to keep.
+    chunk_size (int): The number of elements processed at a time.
+    """
+
+    def __init__(self, tol, dp, top_k=5, chunk_size=DEFAULT_CHUNK_SIZE, distribution=None):
+        self.tol = list(tol)
+        self.dp = list(dp)
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        # optional ErrorDistribution that also receives every chunk's absolute errors
+        self.distribution = distribution
+
+        self.total = 0
+        self.tol_matched = np.zeros(len(self.tol), dtype=np.int64)
+        self.dp_matched = np.zeros(len(self.dp), dtype=np.int64)
+        self.top_values = np.empty(0, dtype=np.float64)
+        self.top_outputs = np.empty(0, dtype=np.int64)
+        self.top_indices = np.empty(0, dtype=np.int64)
+
+    def update(self, output_index, cpu, npu):
+        cpu = np.asarray(cpu).reshape(-1)
+        npu = np.asarray(npu).reshape(-1)
+        # float32 stays float32 (as before); float16 and integers are widened so differences neither lose precision nor wrap
+        work_dtype = np.result_type(cpu.dtype, npu.dtype, np.float32)
+
+        for start in range(0, cpu.size, self.chunk_size):
+            cpu_chunk = cpu[start:start + self.chunk_size]
+            npu_chunk = npu[start:start + self.chunk_size]
+            self._update_chunk(output_index, start, cpu_chunk, npu_chunk, work_dtype)
+
+        self.total += cpu.size
+
+    def _update_chunk(self, output_index, offset, cpu_chunk, npu_chunk, work_dtype):
+        # computed in place where possible, the workspace per element is bounded by workspace_bytes
+        cpu_values = cpu_chunk.astype(work_dtype, copy=False)
+        npu_values = npu_chunk.astype(work_dtype, copy=False)
+        equal = cpu_values == npu_values
+        # identical infinities are not an error; any other NaN difference ranks as the worst error
+        abs_diff = np.subtract(cpu_values, npu_values)
+        np.abs(abs_diff, out=abs_diff)
+        abs_diff[equal] = 0
+        del cpu_values
+
+        # same expression as np.isclose(cpu, npu, atol=tol_val)
+        finite = np.isfinite(npu_values)
+        allowed = np.abs(npu_values)
+        del npu_values
+        allowed *= RTOL
+        bound = np.empty_like(allowed)
+        matched = np.empty(abs_diff.size, dtype=bool)
+        for i, tol_val in enumerate(self.tol):
+            np.add(allowed, tol_val, out=bound)
+            np.less_equal(abs_diff, bound, out=matched)
+            matched &= finite
+            matched |= equal
+            self.tol_matched[i] += np.count_nonzero(matched)
+        del finite, allowed, bound, matched, equal
+
+        for i, dp_val in enumerate(self.dp):
+            self.dp_matched[i] += np.count_nonzero(np.round(cpu_chunk, dp_val) == np.round(npu_chunk, dp_val))
+
+        self._update_top(output_index, offset, abs_diff)
+        if self.distribution is not None:
+            self.distribution.update(abs_diff)
+
+    def _update_top(self, output_index, offset, abs_diff):
+        if self.top_k <= 0 or abs_diff.size == 0:
+            return
+
+        if abs_diff.size > self.top_k:
+            candidates = np.argpartition(abs_diff, -self.top_k)[-self.top_k:]
+        else:
+            candidates = np.arange(abs_diff.size)
+
+        values = np.concatenate([self.top_values, abs_diff[candidates].astype(np.float64)])
+        outputs = np.concatenate([self.top_outputs, np.full(candidates.size, output_index, dtype=np.int64)])
+        indices = np.concatenate([self.top_indices, candidates.astype(np.int64) + offset])
+
+        if values.size > self.top_k:
+            keep = np.argpartition(values, -self.top_k)[-self.top_k:]
+            values, outputs, indices = values[keep], outputs[keep], indices[keep]
+
+        self.top_values, self.top_outputs, self.top_indices = values, outputs, indices
+
+    def _ranked(self):
+        # highest error first, NaN before everything else; stable so equal errors keep output/element order
+        return np.argsort(-np.nan_to_num(self.top_values, nan=np.inf), kind="stable")
+
+    def top_errors(self):
+        return [float(value) for value in self.top_values[self._ranked()]]
+
+    def worst_elements(self):
+        order = self._ranked()
+        return [(int(output), int(index)) for output, index in zip(self.top_outputs[order], self.top_indices[order])]
+
+    def _results(self, matched):
+        if self.total == 0:
+            return [(True, 100) for _ in matched]
+        return [(bool(count == self.total), int((count / self.total) * 100)) for count in matched]
+
+    def tol_results(self):
+        return self._results(self.tol_matched)
+
+    def dp_results(self):
+        return self._results(self.dp_matched)
+
+
+def workspace_bytes(work_dtype, input_dtype):
+    # bytes per chunk element at the peak of ComparisonMetrics._update_chunk: abs_diff, the
+    # tolerance bound and |npu| in the working dtype plus three masks, or the rounded inputs
+    # for the decimal places, or the int64 indices of the top-k and histogram searches
+    work, data = np.dtype(work_dtype).itemsize, np.dtype(input_dtype).itemsize
+    return max(3 * work + 3, work + 2 * data + 1, work + 10)
+
+
+def chunk_size_for_budget(budget_bytes, outputs):
+    """
+    Get the largest chunk size whose comparison workspace fits a memory budget.
+
+    Args:
+    budget_bytes (int): The memory available for the comparison.
+    outputs (list): The (CPU, NPU) output pairs, the widest dtypes decide.
+
+    Returns:
+    int: The number of elements per chunk, at least MIN_CHUNK_SIZE.
+    """
+    per_element = max((workspace_bytes(np.result_type(cpu.dtype, npu.dtype, np.float32), max(cpu.dtype, npu.dtype, key=lambda dtype: dtype.itemsize)) for cpu, npu in outputs), default=workspace_bytes(np.float32, np.float32))
+    return max(MIN_CHUNK_SIZE, int((budget_bytes - WORKSPACE_OVERHEAD) // per_element))
+
+
+class ErrorDistribution:
+    """
+    Streaming distribution of absolute errors: count, sum, max and a fixed log-bin histogram,
+    so memory does not grow with the number of elements or samples.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.zeros = 0
+        self.non_finite = 0
+        self.abs_sum = 0.0
+        self.max = 0.0
+        # bin 0 is below the first edge, the last bin above the last edge
+        self.counts = np.zeros(HISTOGRAM_EDGES.size + 1, dtype=np.int64)
+
+    def update(self, abs_diff):
+        finite = np.isfinite(abs_diff)
+        values = abs_diff[finite] if not finite.all() else abs_diff
+        self.total += abs_diff.size
+        self.non_finite += abs_diff.size - values.size
+        if values.size == 0:
+            return
+
+        # edges in the dtype of the errors, so searchsorted does not widen a float32 chunk to float64;
+        # zeros land in bin 0 and are counted separately
+        zeros = int(np.count_nonzero(values == 0))
+        self.zeros += zeros
+        self.abs_sum += float(values.sum(dtype=np.float64))
+        self.max = max(self.max, float(values.max()))
+        self.counts += np.bincount(np.searchsorted(HISTOGRAM_EDGES.astype(values.dtype), values, side='right'), minlength=self.counts.size)
+        self.counts[0] -= zeros
+
+    def mean(self):
+        finite = self.total - self.non_finite
+        return self.abs_sum / finite if finite else 0.0
+
+    def percentile(self, q):
+        # upper edge of the bin holding the q-th percentile, capped by the largest error seen;
+        # non-finite errors rank above everything
+        if self.total == 0:
+            return 0.0
+        rank = int(np.ceil(q / 100 * self.total))
+        if rank <= self.zeros:
+            return 0.0
+        if rank > self.total - self.non_finite:
+            return float('nan')
+        bin_index = int(np.searchsorted(np.cumsum(self.counts), rank - self.zeros))
+        upper = HISTOGRAM_EDGES[bin_index] if bin_index < HISTOGRAM_EDGES.size else np.inf
+        return min(float(upper), self.max)
+
+
+class SampleStatistics:
+    """
+    Aggregate the comparison of one output set per sample: the error distribution over all
+    samples and the failure rate of every tolerance / decimal-place threshold.
+
+    Args:
+    tol (list): The absolute tolerances to check.
+    dp (list): The decimal places to check.
+    """
+
+    def __init__(self, tol, dp):
+        self.tol = list(tol)
+        self.dp = list(dp)
+        self.samples = 0
+        self.failures = np.zeros(len(self.tol) + len(self.dp), dtype=np.int64)
+        self.distribution = ErrorDistribution()
+
+    def compare(self, cpu_results, npu_results, chunk_size=DEFAULT_CHUNK_SIZE):
+        comparison = compare_outputs(cpu_results, npu_results, self.tol, self.dp, top_k=0, chunk_size=chunk_size, distribution=self.distribution)
+        self.samples += 1
+        self.failures += [not passed for passed, _ in comparison.tol_results() + comparison.dp_results()]
+        return comparison
+
+    def failure_rates(self):
+        return [float(count / self.samples) if self.samples else 0.0 for count in self.failures]
+
+
+def within_tolerance(cpu_values, npu_values, tol_val):
+    # same expression as np.isclose(cpu, npu, atol=tol_val), see ComparisonMetrics._update_chunk
+    equal = cpu_values == npu_values
+    abs_diff = np.abs(cpu_values - npu_values)
+    return equal | ((abs_diff <= tol_val + RTOL * np.abs(npu_values)) & np.isfinite(npu_values))
+
+
+def first_failure(cpu_results, npu_results, tol_val, chunk_size=TRIAGE_CHUNK_SIZE):
+    """
+    Find the first element out of tolerance, stopping at the first failing chunk and
+    computing no other metric.
+
+    Args:
+    cpu_results (list): The CPU output tensors.
+    npu_results (list): The NPU output tensors.
+    tol_val (float): The absolute tolerance.
+    chunk_size (int): The number of elements checked at a time.
+
+    Returns:
+    tuple: The output index and flat element index of the first failing element, or None when every element is within tol_val.
+    """
+    for output_index, (cpu, npu) in enumerate(zip(cpu_results, npu_results)):
+        cpu = np.asarray(cpu).reshape(-1)
+        npu = np.asarray(npu).reshape(-1)
+        work_dtype = np.result_type(cpu.dtype, npu.dtype, np.float32)
+
+        for start in range(0, cpu.size, chunk_size):
+            within = within_tolerance(cpu[start:start + chunk_size].astype(work_dtype, copy=False), npu[start:start + chunk_size].astype(work_dtype, copy=False), tol_val)
+            if not within.all():
+                return output_index, start + int(np.argmin(within))
+    return None
+
+
+def compare_outputs(cpu_results, npu_results, tol, dp, top_k=5, chunk_size=DEFAULT_CHUNK_SIZE, distribution=None):
+    """
+    Compare CPU and NPU outputs in one pass for every threshold.
+
+    Args:
+    cpu_results (list): The CPU output tensors.
+    npu_results (list): The NPU output tensors.
+    tol (list): The absolute tolerances to check.
+    dp (list): The decimal places to check.
+    top_k (int): The number of highest absolute errors to keep.
+    chunk_size (int): The number of elements processed at a time.
+    distribution (ErrorDistribution): Also accumulate the absolute errors into this distribution.
+
+    Returns:
+    ComparisonMetrics: The accumulated metrics.
+    """
+    metrics = ComparisonMetrics(tol, dp, top_k, chunk_size, distribution)
+    for output_index, (cpu, npu) in enumerate(zip(cpu_results, npu_results)):
+        metrics.update(output_index, cpu, npu)
+    return metrics
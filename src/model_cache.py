@@ -0,0 +1,167 @@
+# Two-level cache of compiled models: an in-process LRU of compiled models and an
+# optional on-disk store of exported blobs, so a rerun of the same sweep can import
+# the blobs instead of compiling again.
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """
+    Get the SHA-256 of a file, hashing it at most once per process while it is unchanged.
+
+    Hard links share the digest of the original file (keyed by inode), so
+    weights linked for cut models are not hashed again.
+
+    Args:
+    path (str): The file to hash.
+
+    Returns:
+    str: The hex digest of the file content.
+    """
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def model_digest(model_path):
+    """
+    Get the content key of a model IR: hashes of the .xml and its .bin.
+
+    Args:
+    model_path (str): The path to the model IR (.xml).
+
+    Returns:
+    str: The combined hex digest.
+    """
+    model_path = Path(model_path)
+    bin_path = model_path.parent / (model_path.stem + ".bin")
+    weights_digest = file_digest(bin_path) if bin_path.is_file() else ""
+    return hashlib.sha256(f"{file_digest(model_path)}|{weights_digest}".encode()).hexdigest()
+
+
+class CompiledModelCache:
+    """
+    Cache compiled models keyed by (IR hash, weights hash, device, config).
+
+    Args:
+    max_entries (int): The number of compiled models kept in memory.
+    cache_dir (str): The directory for exported blobs, or None to keep the cache in memory only.
+    """
+
+    def __init__(self, max_entries=8, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # guards the LRU and counters; compilation itself runs outside the lock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.compile_times = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.time_saved = 0.0
+
+    def key(self, model_path, device, config):
+        config_key = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(f"{model_digest(model_path)}|{device}|{config_key}".encode()).hexdigest()
+
+    def compile_model(self, core, model_path, device, config=None):
+        config = config or {}
+
+        # in-memory models have no stable content key, compile them directly
+        if not isinstance(model_path, (str, os.PathLike)):
+            with self.lock:
+                self.uncached += 1
+            return core.compile_model(model_path, device, config)
+
+        key = self.key(model_path, device, config)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.time_saved += self.compile_times.get(key, 0.0)
+                return self.entries[key]
+
+        compiled_model = self._import(core, key, device, config)
+        if compiled_model is None:
+            start = time.perf_counter()
+            compiled_model = core.compile_model(str(model_path), device, config)
+            compile_time = time.perf_counter() - start
+            with self.lock:
+                self.compile_times[key] = compile_time
+                self.misses += 1
+            self._export(key, compiled_model)
+
+        with self.lock:
+            self.entries[key] = compiled_model
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return compiled_model
+
+    def _import(self, core, key, device, config):
+        if not self.cache_dir:
+            return None
+
+        blob_path = self.cache_dir / f"{key}.blob"
+        meta_path = self.cache_dir / f"{key}.json"
+        if not blob_path.is_file() or not meta_path.is_file():
+            return None
+
+        try:
+            start = time.perf_counter()
+            with open(blob_path, 'rb') as file:
+                compiled_model = core.import_model(file.read(), device, config)
+            import_time = time.perf_counter() - start
+            with open(meta_path) as file:
+                compile_time = json.load(file)["compile_time"]
+        except (RuntimeError, OSError, ValueError, KeyError) as e:
+            print(f"Cannot import cached model {blob_path}: {str(e)}")
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+            self.compile_times[key] = compile_time
+            self.time_saved += max(0.0, compile_time - import_time)
+        return compiled_model
+
+    def _export(self, key, compiled_model):
+        if not self.cache_dir:
+            return
+
+        blob_path = self.cache_dir / f"{key}.blob"
+        meta_path = self.cache_dir / f"{key}.json"
+        temp_path = self.cache_dir / f"{key}.{threading.get_ident()}.tmp"
+        try:
+            stream = io.BytesIO()
+            compiled_model.export_model(stream)
+            # write to a temporary file first so an interrupted run never leaves a truncated blob
+            with open(temp_path, 'wb') as file:
+                file.write(stream.getvalue())
+            os.replace(temp_path, blob_path)
+            with open(meta_path, 'w') as file:
+                json.dump({"compile_time": self.compile_times[key]}, file)
+        except (RuntimeError, OSError) as e:
+            print(f"Cannot export compiled model to {blob_path}: {str(e)}")
+
+    def report(self):
+        print(f"Compiled model cache: {self.hits} memory hits, {self.disk_hits} disk hits, "
+              f"{self.misses} misses, {self.uncached} uncached, {self.time_saved:.1f}s compile time saved")
@@ -0,0 +1,181 @@
+# Lightweight per-stage instrumentation of a sweep: wall time, bytes read/written and
+# peak RSS of every stage (parse, cut, write, compile, infer, compare, ...) per node,
+# with a summary table and a Chrome trace-event export (chrome://tracing, Perfetto).
+# When disabled, a stage is a shared no-op context manager.
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# records written while profiling is disabled are discarded
+_DISABLED = nullcontext({})
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of this process in bytes, or None when it cannot be measured.
+    """
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return rss if sys.platform == "darwin" else rss * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+@contextmanager
+def traced_memory(enabled=True):
+    # peak of the Python and numpy allocations made inside the block, in bytes; buffers owned by
+    # OpenVINO (e.g. infer request outputs) are not traced, and comparisons running at once in
+    # several threads are counted together. Tracing slows every allocation down, so when not
+    # enabled nothing is traced and the record stays empty
+    record = {}
+    if not enabled:
+        yield record
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        yield record
+    finally:
+        record["peak"] = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+        if started:
+            tracemalloc.stop()
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def disable(self):
+        self.enabled = False
+
+    def set_node(self, node):
+        self.local.node = node
+
+    def stage(self, name, **args):
+        if not self.enabled:
+            return _DISABLED
+        return self._stage(name, args)
+
+    @contextmanager
+    def _stage(self, name, args):
+        # the yielded record can be extended by the caller, e.g. with bytes_written
+        record = dict(args)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "node": getattr(self.local, "node", None),
+                "start": start - self.origin,
+                "duration": end - start,
+                "peak_rss": peak_rss(),
+                "tid": threading.get_ident(),
+                "args": record,
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def summary(self):
+        stages = {}
+        for event in self.events:
+            stage = stages.setdefault(event["name"], {"count": 0, "total": 0.0, "max": 0.0, "bytes_read": 0, "bytes_written": 0})
+            stage["count"] += 1
+            stage["total"] += event["duration"]
+            stage["max"] = max(stage["max"], event["duration"])
+            stage["bytes_read"] += event["args"].get("bytes_read", 0)
+            stage["bytes_written"] += event["args"].get("bytes_written", 0)
+        return stages
+
+    def print_summary(self):
+        stages = self.summary()
+        total = sum(stage["total"] for stage in stages.values()) or 1.0
+        print(f"{'stage':<16}{'count':>8}{'total s':>12}{'mean ms':>12}{'max ms':>12}{'share':>8}{'read MB':>12}{'written MB':>12}")
+        for name, stage in sorted(stages.items(), key=lambda item: -item[1]["total"]):
+            print(f"{name:<16}{stage['count']:>8}{stage['total']:>12.3f}{1000 * stage['total'] / stage['count']:>12.2f}"
+                  f"{1000 * stage['max']:>12.2f}{stage['total'] / total:>8.1%}"
+                  f"{stage['bytes_read'] / 2 ** 20:>12.1f}{stage['bytes_written'] / 2 ** 20:>12.1f}")
+
+    def write_summary(self, output_csv_filepath):
+        # one row per (node, stage) with the peak RSS seen at the end of the stage
+        rows = {}
+        for event in self.events:
+            row = rows.setdefault((event["node"], event["name"]), {"count": 0, "total": 0.0, "bytes_read": 0, "bytes_written": 0, "peak_rss": 0})
+            row["count"] += 1
+            row["total"] += event["duration"]
+            row["bytes_read"] += event["args"].get("bytes_read", 0)
+            row["bytes_written"] += event["args"].get("bytes_written", 0)
+            row["peak_rss"] = max(row["peak_rss"], event["peak_rss"] or 0)
+
+        with open(output_csv_filepath, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Node", "Stage", "Count", "Wall time (s)", "Bytes read", "Bytes written", "Peak RSS (bytes)"])
+            for (node, name), row in rows.items():
+                writer.writerow([node, name, row["count"], f"{row['total']:.6f}", row["bytes_read"], row["bytes_written"], row["peak_rss"]])
+
+        print(f"Profile summary saved to {output_csv_filepath}")
+
+    def export_chrome_trace(self, output_json_filepath):
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": "stage",
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": pid,
+                "tid": event["tid"],
+                "args": dict(event["args"], node=event["node"], peak_rss=event["peak_rss"]),
+            }
+            for event in self.events
+        ]
+        with open(output_json_filepath, 'w') as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file, default=str)
+
+        print(f"Chrome trace saved to {output_json_filepath}")
+
+    def report(self, output_folder):
+        self.print_summary()
+        self.write_summary(os.path.join(output_folder, "profile_summary.csv"))
+        self.export_chrome_trace(os.path.join(output_folder, "profile_trace.json"))
+
+
+profiler = Profiler()
+enable = profiler.enable
+disable = profiler.disable
+set_node = profiler.set_node
+stage = profiler.stage
+report = profiler.report
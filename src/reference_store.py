@@ -0,0 +1,136 @@
+# Content-addressed store of reference (CPU) outputs. Outputs are saved as .npy files
+# keyed by the IR/weights hash, the input hash and the device config, and memory-mapped
+# back on reuse, so NPU-only reruns skip CPU compilation and inference.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+import openvino as ov
+import model_cache
+
+MANIFEST = "manifest.json"
+
+
+def input_digest(input_data):
+    """
+    Get the SHA-256 of the input tensors (shape, type and content).
+
+    Args:
+    input_data (list): The input tensors (ov.Tensor or numpy arrays).
+
+    Returns:
+    str: The hex digest of the inputs.
+    """
+    digest = hashlib.sha256()
+    for tensor in input_data:
+        array = np.ascontiguousarray(getattr(tensor, "data", tensor))
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+class ReferenceStore:
+    """
+    Store reference outputs on disk and evict the least recently used entries by total size.
+
+    Args:
+    store_dir (str): The directory of the store.
+    max_bytes (int): The total size of the stored outputs before entries are evicted.
+    """
+
+    def __init__(self, store_dir, max_bytes=10 * 1024 ** 3):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, model_path, input_data, device="CPU", config=None):
+        # the runtime version is part of the key: a new CPU plugin may produce a different reference
+        config_key = json.dumps(config or {}, sort_keys=True, default=str)
+        return hashlib.sha256(f"{model_cache.model_digest(model_path)}|{input_digest(input_data)}|{device}|{config_key}|{ov.get_version()}".encode()).hexdigest()
+
+    def load(self, key):
+        entry_dir = self.store_dir / key
+        manifest_path = entry_dir / MANIFEST
+        if not manifest_path.is_file():
+            return None
+
+        try:
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+            outputs = [np.load(entry_dir / name, mmap_mode='r') for name in manifest["outputs"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Cannot load reference outputs {entry_dir}: {str(e)}")
+            return None
+
+        # the manifest mtime is the last use, used for eviction
+        os.utime(manifest_path)
+        return outputs
+
+    def save(self, key, outputs, model_path=None):
+        entry_dir = self.store_dir / key
+        temp_dir = self.store_dir / f"{key}.{os.getpid()}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        temp_dir.mkdir()
+
+        names = []
+        for i, output in enumerate(outputs):
+            names.append(f"output_{i}.npy")
+            np.save(temp_dir / names[-1], np.asarray(output))
+
+        manifest = {
+            "outputs": names,
+            "model": model_cache.model_digest(model_path) if model_path else None,
+            "created": time.time(),
+        }
+        with open(temp_dir / MANIFEST, 'w') as file:
+            json.dump(manifest, file)
+
+        # publish the entry at once so readers never see a partial one
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temp_dir, entry_dir)
+
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry_dir in self.store_dir.iterdir():
+            manifest_path = entry_dir / MANIFEST
+            if entry_dir.suffix == ".tmp" or not manifest_path.is_file():
+                continue
+            size = sum(path.stat().st_size for path in entry_dir.iterdir())
+            entries.append((manifest_path.stat().st_mtime, size, entry_dir))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            print(f"Evicting reference outputs {entry_dir.name}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def invalidate(self, key=None, model_path=None):
+        """
+        Remove one entry by key, every entry of a model, or the whole store when neither is given.
+
+        Args:
+        key (str): The key of the entry to remove.
+        model_path (str): The model IR whose entries are removed.
+        """
+        if key is not None:
+            shutil.rmtree(self.store_dir / key, ignore_errors=True)
+            return
+
+        digest = model_cache.model_digest(model_path) if model_path else None
+        for _, _, entry_dir in self.entries():
+            if digest is not None:
+                with open(entry_dir / MANIFEST) as file:
+                    if json.load(file).get("model") != digest:
+                        continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
@@ -0,0 +1,153 @@
+# Typed columnar store of result rows. Every result file is also saved as a compressed
+# .npz with numeric columns (top-k errors, their locations, per-threshold pass flags and
+# match percentages) and the run metadata, so analysis can load many runs without
+# parsing the comma-joined strings of the CSV export.
+
+import json
+import os
+import time
+import numpy as np
+
+TOP_K = 5
+COLUMNS = ["node", "status", "top_errors", "worst_output", "worst_index", "passed", "match_percentage", "peak_memory", "thresholds", "metadata"]
+
+
+class ResultRow(list):
+    """
+    A CSV result row that also keeps the numeric metrics it was formatted from.
+
+    Args:
+    values (list): The CSV cells of the row.
+    metrics (dict): The numeric metrics: top_errors, worst_elements, one (passed, match_percentage) per threshold
+    and the peak_memory of the check in bytes when it was measured.
+    """
+
+    def __init__(self, values, metrics=None):
+        super().__init__(values)
+        self.metrics = metrics
+
+
+def threshold_labels(tol, dp):
+    return [str(tol_val) for tol_val in tol] + [f"{dp_val}dp" for dp_val in dp]
+
+
+def parse_row(row, n_thresholds):
+    """
+    Recover the numeric metrics of a row that only has its CSV cells, e.g. a row read back
+    from a journal or an old CSV. Error rows ("Model loading failed", ...) return None.
+
+    Args:
+    row (list): The CSV cells of the row.
+    n_thresholds (int): The number of tolerance and dp thresholds of the run.
+
+    Returns:
+    dict: The numeric metrics, or None when the row has none.
+    """
+    if len(row) < 2 + n_thresholds:
+        return None
+
+    try:
+        top_errors = [float(error) for error in str(row[1]).split(',') if error]
+        results = []
+        for label in row[2:2 + n_thresholds]:
+            state, match_percentage = str(label).split()
+            results.append((state == "passed", int(match_percentage)))
+    except ValueError:
+        return None
+
+    worst_elements = []
+    if len(row) > 4 + n_thresholds and row[4 + n_thresholds]:
+        worst_elements = [tuple(int(value) for value in element.split(':')) for element in str(row[4 + n_thresholds]).split(',')]
+
+    return {"top_errors": top_errors, "worst_elements": worst_elements, "results": results}
+
+
+def to_columns(results, tol, dp, top_k=TOP_K):
+    """
+    Convert result rows to typed columns. Missing top-k entries are NaN (errors) or -1 (locations),
+    match percentages of rows without metrics are NaN and an unknown peak memory is -1.
+
+    Args:
+    results (list): The result rows.
+    tol (list): The tolerances of the run.
+    dp (list): The decimal places of the run.
+    top_k (int): The number of top errors per row.
+
+    Returns:
+    dict: The columns as numpy arrays.
+    """
+    thresholds = threshold_labels(tol, dp)
+    n = len(results)
+    columns = {
+        "node": np.array([str(row[0]) for row in results], dtype=str),
+        "status": np.empty(n, dtype=object),
+        "top_errors": np.full((n, top_k), np.nan, dtype=np.float64),
+        "worst_output": np.full((n, top_k), -1, dtype=np.int64),
+        "worst_index": np.full((n, top_k), -1, dtype=np.int64),
+        "passed": np.zeros((n, len(thresholds)), dtype=bool),
+        "match_percentage": np.full((n, len(thresholds)), np.nan, dtype=np.float32),
+        "peak_memory": np.full(n, -1, dtype=np.int64),
+        "thresholds": np.array(thresholds, dtype=str),
+    }
+
+    for i, row in enumerate(results):
+        row_metrics = getattr(row, "metrics", None) or parse_row(row, len(thresholds))
+        if row_metrics is None:
+            columns["status"][i] = str(row[1]) if len(row) > 1 else "failed"
+            continue
+
+        columns["status"][i] = "ok"
+        top_errors = row_metrics["top_errors"][:top_k]
+        columns["top_errors"][i, :len(top_errors)] = top_errors
+        for j, (output, index) in enumerate(row_metrics["worst_elements"][:top_k]):
+            columns["worst_output"][i, j] = output
+            columns["worst_index"][i, j] = index
+        for j, (passed, match_percentage) in enumerate(row_metrics["results"]):
+            columns["passed"][i, j] = passed
+            columns["match_percentage"][i, j] = match_percentage
+        columns["peak_memory"][i] = row_metrics.get("peak_memory", -1)
+
+    columns["status"] = columns["status"].astype(str)
+    return columns
+
+
+def write_result_store(results, output_filepath, tol, dp, metadata=None):
+    """
+    Save result rows as a compressed .npz of typed columns.
+
+    Args:
+    results (list): The result rows.
+    output_filepath (str): The .npz file to write.
+    tol (list): The tolerances of the run.
+    dp (list): The decimal places of the run.
+    metadata (dict): Run metadata saved with the columns (run name, device, runtime version, ...).
+    """
+    columns = to_columns(results, tol, dp)
+    metadata = dict(metadata or {}, tol=list(tol), dp=list(dp), created=time.time())
+    columns["metadata"] = np.array(json.dumps(metadata, default=str))
+
+    # write next to the target and rename, so a reader never sees a partial file
+    temp_filepath = f"{output_filepath}.{os.getpid()}.tmp"
+    with open(temp_filepath, 'wb') as file:
+        np.savez_compressed(file, **columns)
+        bytes_written = file.tell()
+    os.replace(temp_filepath, output_filepath)
+
+    print(f"Results saved to {output_filepath}")
+    return bytes_written
+
+
+def load_result_store(filepath):
+    """
+    Load the columns of a result store.
+
+    Args:
+    filepath (str): The .npz file to read.
+
+    Returns:
+    dict: The columns as numpy arrays, with the metadata decoded to a dict.
+    """
+    with np.load(filepath, allow_pickle=False) as data:
+        columns = {name: data[name] for name in COLUMNS if name in data}
+    columns["metadata"] = json.loads(str(columns.get("metadata", "{}")))
+    return columns
@@ -0,0 +1,210 @@
+# Generator of synthetic OpenVINO IR (v11 XML + .bin) for benchmarks: plain chains, wide
+# fan-out, residual blocks and attention-like blocks, of any size from a few layers to
+# 100k+. The XML is written directly, so generating large graphs is fast and the layer
+# names follow the "/model/layers.N/..." style of exported models.
+
+import os
+from pathlib import Path
+import numpy as np
+from lxml import etree
+
+TOPOLOGIES = ["chain", "fanout", "residual", "attention"]
+
+
+class IRBuilder:
+    """
+    Build an IR layer by layer. Activations are [1, seq_len, hidden] (attention scores
+    [1, seq_len, seq_len]), weights are [hidden, hidden].
+
+    Args:
+    name (str): The model name.
+    seq_len (int): The sequence length of the activations.
+    hidden (int): The hidden size of the activations and weights.
+    seed (int): The seed of the weights.
+    """
+
+    def __init__(self, name, seq_len=4, hidden=8, seed=0):
+        self.name = name
+        self.shape = [1, seq_len, hidden]
+        self.hidden = hidden
+        self.random_state = np.random.RandomState(seed)
+        self.layers = []
+        self.shapes = []
+        self.edges = []
+        self.weights = []
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.layers)
+
+    def _layer(self, name, layer_type, version, data, input_shapes, output_shape):
+        layer_id = len(self.layers)
+        layer = etree.Element("layer", id=str(layer_id), name=name, type=layer_type, version=version)
+        if data is not None:
+            etree.SubElement(layer, "data", {key: str(value) for key, value in data.items()})
+        if input_shapes:
+            inputs = etree.SubElement(layer, "input")
+            for port_id, shape in enumerate(input_shapes):
+                add_port(inputs, port_id, shape)
+        if output_shape is not None:
+            outputs = etree.SubElement(layer, "output")
+            add_port(outputs, len(input_shapes), output_shape, name if layer_type == "Parameter" else None)
+        self.layers.append(layer)
+        self.shapes.append(output_shape)
+        return layer_id
+
+    def _connect(self, sources, layer_id):
+        # every layer has one output port, numbered after its inputs
+        for to_port, source in enumerate(sources):
+            from_port = int(self.layers[source].find("output/port").get("id"))
+            self.edges.append((source, from_port, layer_id, to_port))
+
+    def parameter(self, name):
+        return self._layer(name, "Parameter", "opset1", {"shape": ",".join(map(str, self.shape)), "element_type": "f32"}, [], self.shape)
+
+    def const(self, name):
+        weight = self.random_state.rand(self.hidden, self.hidden).astype(np.float32)
+        data = {"element_type": "f32", "shape": f"{self.hidden}, {self.hidden}", "offset": self.offset, "size": weight.nbytes}
+        self.weights.append(weight)
+        self.offset += weight.nbytes
+        return self._layer(name, "Const", "opset1", data, [], [self.hidden, self.hidden])
+
+    def op(self, name, layer_type, sources, data=None, version="opset1", output_shape=None):
+        # elementwise by default: the output has the shape of the first input
+        input_shapes = [self.shapes[source] for source in sources]
+        layer_id = self._layer(name, layer_type, version, data, input_shapes, output_shape or input_shapes[0])
+        self._connect(sources, layer_id)
+        return layer_id
+
+    def matmul(self, name, a, b, transpose_b=False):
+        a_shape, b_shape = self.shapes[a], self.shapes[b]
+        output_shape = a_shape[:-1] + [b_shape[-2] if transpose_b else b_shape[-1]]
+        return self.op(name, "MatMul", [a, b], {"transpose_a": "false", "transpose_b": str(transpose_b).lower()}, output_shape=output_shape)
+
+    def add(self, name, a, b):
+        return self.op(name, "Add", [a, b], {"auto_broadcast": "numpy"})
+
+    def multiply(self, name, a, b):
+        return self.op(name, "Multiply", [a, b], {"auto_broadcast": "numpy"})
+
+    def relu(self, name, a):
+        return self.op(name, "Relu", [a])
+
+    def softmax(self, name, a):
+        return self.op(name, "SoftMax", [a], {"axis": "-1"}, version="opset8")
+
+    def result(self, name, a):
+        layer_id = self._layer(name, "Result", "opset1", None, [self.shapes[a]], None)
+        self._connect([a], layer_id)
+        return layer_id
+
+    def write(self, xml_path):
+        """
+        Write the IR and its weights (same stem, .bin).
+
+        Args:
+        xml_path (str): The .xml file to write.
+
+        Returns:
+        int: The number of layers written.
+        """
+        xml_path = Path(xml_path)
+        net = etree.Element("net", name=self.name, version="11")
+        layers = etree.SubElement(net, "layers")
+        layers.extend(self.layers)
+        edges = etree.SubElement(net, "edges")
+        for from_layer, from_port, to_layer, to_port in self.edges:
+            etree.SubElement(edges, "edge", {"from-layer": str(from_layer), "from-port": str(from_port), "to-layer": str(to_layer), "to-port": str(to_port)})
+
+        etree.ElementTree(net).write(str(xml_path), pretty_print=True)
+        with open(xml_path.with_suffix(".bin"), 'wb') as file:
+            for weight in self.weights:
+                file.write(weight.tobytes())
+        return len(self.layers)
+
+
+def add_port(parent, port_id, shape, names=None):
+    port = etree.SubElement(parent, "port", id=str(port_id), precision="FP32")
+    if names:
+        port.set("names", names)
+    for dim in shape:
+        etree.SubElement(port, "dim").text = str(dim)
+    return port
+
+
+def chain_block(builder, i, h, inputs):
+    m = builder.multiply(f"/model/layers.{i}/Multiply", h, inputs[1])
+    m = builder.matmul(f"/model/layers.{i}/MatMul", m, builder.const(f"/model/layers.{i}/w/weight"))
+    a = builder.add(f"/model/layers.{i}/Add", m, inputs[0])
+    return builder.relu(f"/model/layers.{i}/Relu", a)
+
+
+def fanout_block(builder, i, h, inputs, width=8):
+    # one producer feeding `width` parallel branches that are summed back together
+    branches = [builder.relu(f"/model/layers.{i}/branch.{j}/Relu", builder.multiply(f"/model/layers.{i}/branch.{j}/Multiply", h, inputs[1])) for j in range(width)]
+    total = branches[0]
+    for j, branch in enumerate(branches[1:], 1):
+        total = builder.add(f"/model/layers.{i}/sum.{j}/Add", total, branch)
+    return total
+
+
+def residual_block(builder, i, h, inputs):
+    m = builder.matmul(f"/model/layers.{i}/MatMul", h, builder.const(f"/model/layers.{i}/w/weight"))
+    a = builder.add(f"/model/layers.{i}/Add", m, inputs[1])
+    s = builder.softmax(f"/model/layers.{i}/Softmax", builder.relu(f"/model/layers.{i}/Relu", a))
+    return builder.add(f"/model/layers.{i}/residual", s, h)
+
+
+def attention_block(builder, i, h, inputs):
+    prefix = f"/model/layers.{i}/self_attn"
+    q, k, v = (builder.matmul(f"{prefix}/{proj}_proj/MatMul", h, builder.const(f"{prefix}/{proj}_proj/weight")) for proj in "qkv")
+    scores = builder.softmax(f"{prefix}/Softmax", builder.matmul(f"{prefix}/scores/MatMul", q, k, transpose_b=True))
+    o = builder.matmul(f"{prefix}/o_proj/MatMul", builder.matmul(f"{prefix}/MatMul", scores, v), builder.const(f"{prefix}/o_proj/weight"))
+    return builder.add(f"/model/layers.{i}/residual", o, h)
+
+
+BLOCKS = {
+    "chain": chain_block,
+    "fanout": fanout_block,
+    "residual": residual_block,
+    "attention": attention_block,
+}
+
+
+def generate_ir(xml_path, topology="residual", num_layers=100, seq_len=4, hidden=8, seed=0):
+    """
+    Generate a synthetic IR with about num_layers layers (whole blocks are added until the size is reached).
+
+    Args:
+    xml_path (str): The .xml file to write, the weights are written next to it.
+    topology (str): One of TOPOLOGIES.
+    num_layers (int): The approximate number of layers.
+    seq_len (int): The sequence length of the activations.
+    hidden (int): The hidden size of the activations and weights.
+    seed (int): The seed of the weights.
+
+    Returns:
+    int: The number of layers written.
+    """
+    if topology not in BLOCKS:
+        raise Exception(f"Unknown topology {topology}, expected one of {TOPOLOGIES}")
+
+    builder = IRBuilder(Path(xml_path).stem, seq_len, hidden, seed)
+    inputs = [builder.parameter("input_ids"), builder.parameter("attention_mask")]
+    h = inputs[0]
+    i = 0
+    # leave room for the Result layer
+    while len(builder) < num_layers - 1 or i == 0:
+        h = BLOCKS[topology](builder, i, h, inputs)
+        i += 1
+    builder.result("logits", h)
+
+    os.makedirs(Path(xml_path).parent, exist_ok=True)
+    return builder.write(xml_path)
+
+
+if __name__ == "__main__":
+    # Example:
+    # python synthetic_ir.py
+    for topology in TOPOLOGIES:
+        print(f"{topology}: {generate_ir(f'synthetic/{topology}_1000.xml', topology, 1000)} layers")
@@ -0,0 +1,394 @@
+# Distributed sweeps: a coordinator enqueues (subgraph, node) tasks into a SQLite queue,
+# workers on any host claim them, run the check and post the rows back, and collect
+# writes the usual result files. A claimed task is leased; the worker renews the lease
+# while checking, so a worker that dies or hangs lets the lease expire and the task is
+# retried by another worker, up to max_attempts times.
+#
+# The queue is one SQLite file. On one machine any local path works; across machines put
+# it on a share with working file locks (SQLite's rollback journal is used, not WAL, so
+# no shared memory is needed between hosts).
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import openvino as ov
+from dotenv import load_dotenv
+import accuracy_check
+import accuracy_check_for_subgraph
+import journal as result_journal
+import model_cache
+import result_store
+
+load_dotenv()
+
+# node of a whole-subgraph task (accuracy_check_per_subgraph)
+SUBGRAPH_NODE = ""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    subgraph TEXT NOT NULL,
+    node TEXT NOT NULL,
+    config TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    row TEXT,
+    metrics TEXT,
+    error TEXT,
+    UNIQUE (subgraph, node, config)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+"""
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of check tasks shared by a coordinator and its workers.
+
+    Args:
+    path (str): The queue database file.
+    lease_seconds (float): How long a claimed task stays leased without a heartbeat.
+    max_attempts (int): How often a task is claimed before it is marked failed.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        # one short-lived autocommit connection per call, so the heartbeat thread and worker processes never share one
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return closing(connection)
+
+    def set_settings(self, **settings):
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)", [(key, json.dumps(value)) for key, value in settings.items()])
+
+    def settings(self):
+        with self._connect() as connection:
+            return {row["key"]: json.loads(row["value"]) for row in connection.execute("SELECT key, value FROM settings")}
+
+    def enqueue(self, subgraph, nodes, config):
+        """
+        Add tasks, tasks already in the queue are kept with their state and rows.
+
+        Args:
+        subgraph (str): The subgraph IR file name.
+        nodes (list): The nodes to check, SUBGRAPH_NODE checks the whole subgraph.
+        config (str): The journal config key of the thresholds.
+
+        Returns:
+        int: The number of new tasks.
+        """
+        with self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO tasks (subgraph, node, config) VALUES (?, ?, ?)", [(subgraph, node, config) for node in nodes])
+            return connection.total_changes - before
+
+    def _expire_leases(self, connection, now):
+        # leases of dead or hung workers go back to the queue, or fail after max_attempts claims
+        connection.execute("UPDATE tasks SET state = 'failed', error = 'Lease expired' WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+        connection.execute("UPDATE tasks SET state = 'pending', worker = NULL WHERE state = 'leased' AND lease_expires < ?", (now,))
+
+    def claim(self, worker):
+        """
+        Lease the next pending task.
+
+        Args:
+        worker (str): The id of the claiming worker.
+
+        Returns:
+        dict: The task (id, subgraph, node, config, attempts), or None when nothing is pending.
+        """
+        with self._connect() as connection:
+            # the write lock is taken up front, so two workers never claim the same task
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._expire_leases(connection, now)
+                task = connection.execute("SELECT id, subgraph, node, config, attempts FROM tasks WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+                if task is not None:
+                    connection.execute("UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?", (worker, now + self.lease_seconds, task["id"]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return dict(task, attempts=task["attempts"] + 1) if task is not None else None
+
+    def heartbeat(self, task_id, worker):
+        # False when the lease was lost, e.g. it expired and another worker claimed the task
+        with self._connect() as connection:
+            cursor = connection.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'", (time.time() + self.lease_seconds, task_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker, row):
+        # rows of a worker that lost its lease are dropped, the task's new owner posts its own
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET state = 'done', row = ?, metrics = ?, error = NULL, lease_expires = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps([str(value) for value in row]), json.dumps(getattr(row, "metrics", None)), task_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, task_id, worker, error):
+        # a task that raised is retried until max_attempts, then marked failed
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL, lease_expires = NULL, error = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (self.max_attempts, error, task_id, worker),
+            )
+
+    def retry_failed(self):
+        with self._connect() as connection:
+            return connection.execute("UPDATE tasks SET state = 'pending', attempts = 0, worker = NULL WHERE state = 'failed'").rowcount
+
+    def counts(self):
+        with self._connect() as connection:
+            self._expire_leases(connection, time.time())
+            return {row["state"]: row["count"] for row in connection.execute("SELECT state, COUNT(*) AS count FROM tasks GROUP BY state")}
+
+    def results(self):
+        """
+        Get the result row of every task in enqueue order. Tasks that are not done yet get an error row.
+
+        Returns:
+        dict: (subgraph, config) -> list of (node, row).
+        """
+        results = {}
+        with self._connect() as connection:
+            for task in connection.execute("SELECT subgraph, node, config, state, row, metrics, error FROM tasks ORDER BY id"):
+                name = task["node"] or task["subgraph"]
+                if task["state"] == "done":
+                    row = result_store.ResultRow(json.loads(task["row"]), json.loads(task["metrics"]))
+                elif task["state"] == "failed":
+                    row = [name, f"Worker failed: {task['error']}"]
+                else:
+                    row = [name, "Not checked"]
+                results.setdefault((task["subgraph"], task["config"]), []).append((task["node"], row))
+        return results
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def coordinate(queue, subgraph_folder_cpu, subgraph_folder_npu, output_folder, tol, dp, mode="for_subgraph", target_device="NPU", in_memory=False):
+    """
+    Enqueue the tasks of a sweep. Running it again only adds the tasks that are missing.
+
+    Args:
+    queue (WorkQueue): The queue.
+    subgraph_folder_cpu (str): The folder of the CPU subgraph IRs.
+    subgraph_folder_npu (str): The folder of the NPU subgraph IRs.
+    output_folder (str): The folder collect writes the results to.
+    tol (list): The tolerances.
+    dp (list): The decimal places.
+    mode (str): "for_subgraph" enqueues one task per node, "per_subgraph" one task per subgraph.
+    target_device (str): The device the workers compare against CPU.
+    in_memory (bool): Let the workers cut the nodes in memory.
+
+    Returns:
+    int: The number of new tasks.
+    """
+    if mode not in ("for_subgraph", "per_subgraph"):
+        raise Exception(f"Unknown mode {mode}, expected for_subgraph or per_subgraph")
+
+    queue.set_settings(subgraph_folder_cpu=subgraph_folder_cpu, subgraph_folder_npu=subgraph_folder_npu, output_folder=output_folder, mode=mode, target_device=target_device, in_memory=in_memory)
+    config = result_journal.config_key(tol, dp)
+
+    subgraph_files = sorted({f for f in os.listdir(subgraph_folder_cpu) if f.endswith('.xml')} & {f for f in os.listdir(subgraph_folder_npu) if f.endswith('.xml')}, key=accuracy_check.extract_number)
+    added = 0
+    for subgraph_file in subgraph_files:
+        if mode == "per_subgraph":
+            nodes = [SUBGRAPH_NODE]
+        else:
+            model_path_cpu = os.path.join(subgraph_folder_cpu, subgraph_file)
+            model_path_npu = os.path.join(subgraph_folder_npu, subgraph_file)
+            nodes = accuracy_check_for_subgraph.get_matched_node_list(modelpath=model_path_cpu) if model_path_cpu != model_path_npu else accuracy_check_for_subgraph.get_node_list(modelpath=model_path_npu)
+        added += queue.enqueue(subgraph_file, nodes, config)
+
+    print(f"Enqueued {added} new tasks of {len(subgraph_files)} subgraphs to {queue.path}")
+    return added
+
+
+def keep_leased(queue, task_id, worker, stop, task_timeout):
+    # renew the lease while the check runs; after task_timeout the renewals stop, so a hung
+    # check loses its task to another worker
+    deadline = time.time() + task_timeout
+    while not stop.wait(queue.lease_seconds / 3) and time.time() < deadline:
+        if not queue.heartbeat(task_id, worker):
+            return
+
+
+def run_worker(queue_path, subgraph_folder_cpu=None, subgraph_folder_npu=None, target_device=None, lease_seconds=300, max_attempts=3, task_timeout=3600, poll_seconds=5, exit_when_empty=True, cache_dir=None):
+    """
+    Claim and check tasks until the queue is drained.
+
+    Args:
+    queue_path (str): The queue database file.
+    subgraph_folder_cpu (str): The CPU subgraph folder on this host, the coordinator's by default.
+    subgraph_folder_npu (str): The NPU subgraph folder on this host, the coordinator's by default.
+    target_device (str): The device to compare against CPU, the coordinator's by default.
+    lease_seconds (float): The lease of a claimed task.
+    max_attempts (int): The number of claims before a task fails.
+    task_timeout (float): The longest a single check may keep its lease.
+    poll_seconds (float): The wait between claims while other workers still hold leases.
+    exit_when_empty (bool): Exit when no task is pending or leased, otherwise keep polling.
+    cache_dir (str): The compiled model cache directory, memory only when None.
+
+    Returns:
+    int: The number of tasks completed by this worker.
+    """
+    queue = WorkQueue(queue_path, lease_seconds, max_attempts)
+    settings = queue.settings()
+    subgraph_folder_cpu = subgraph_folder_cpu or settings["subgraph_folder_cpu"]
+    subgraph_folder_npu = subgraph_folder_npu or settings["subgraph_folder_npu"]
+    target_device = target_device or settings["target_device"]
+
+    worker = worker_id()
+    core = ov.Core()
+    cache = model_cache.CompiledModelCache(cache_dir=cache_dir)
+    weights = {}
+    completed = 0
+
+    while True:
+        task = queue.claim(worker)
+        if task is None:
+            counts = queue.counts()
+            if exit_when_empty and not counts.get("pending") and not counts.get("leased"):
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        print(f"[{worker}] {task['subgraph']} {task['node']} (attempt {task['attempts']})")
+        config = json.loads(task["config"])
+        model_path_cpu = os.path.join(subgraph_folder_cpu, task["subgraph"])
+        model_path_npu = os.path.join(subgraph_folder_npu, task["subgraph"])
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=keep_leased, args=(queue, task["id"], worker, stop, task_timeout), daemon=True)
+        heartbeat.start()
+        try:
+            if task["node"] == SUBGRAPH_NODE:
+                row = accuracy_check.accuracy_check(task["subgraph"], core, model_path_cpu, model_path_npu, config["tol"], config["dp"], cache, target_device=target_device)
+            else:
+                # the source weights stay mapped while this worker checks nodes of the same subgraph
+                if settings.get("in_memory") and task["subgraph"] not in weights:
+                    weights = {task["subgraph"]: accuracy_check_for_subgraph.load_source_weights(model_path_cpu, model_path_npu, True)}
+                weights_cpu, weights_npu = weights.get(task["subgraph"], (None, None))
+                row = accuracy_check_for_subgraph.check_node(core, model_path_cpu, model_path_npu, task["node"], config["tol"], config["dp"], weights_cpu, weights_npu, cache, target_device=target_device)
+        except Exception as e:
+            print(f"[{worker}] Task {task['id']} failed: {str(e)}")
+            queue.release(task["id"], worker, str(e))
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if queue.complete(task["id"], worker, row):
+            completed += 1
+        else:
+            print(f"[{worker}] Lease of task {task['id']} was lost, result dropped")
+
+    print(f"[{worker}] Completed {completed} tasks")
+    return completed
+
+
+def run_workers(processes, queue_path, **kwargs):
+    # several workers on one host, e.g. CPU-only development or one worker per NPU
+    workers = [multiprocessing.Process(target=run_worker, args=(queue_path,), kwargs=kwargs) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def collect(queue, output_folder=None, output_csv=None):
+    """
+    Write the result files of the sweep from the rows posted so far.
+
+    Args:
+    queue (WorkQueue): The queue.
+    output_folder (str): The folder of the per-subgraph results, the coordinator's by default.
+    output_csv (str): The result CSV of a per_subgraph sweep, <output_folder>/result_subgraphs.csv by default.
+
+    Returns:
+    dict: The number of tasks per state.
+    """
+    settings = queue.settings()
+    output_folder = output_folder or settings["output_folder"]
+    results = queue.results()
+
+    if settings["mode"] == "per_subgraph":
+        for config, rows in group_by_config(results).items():
+            rows = [row for _, row in rows]
+            rows.sort(key=lambda x: accuracy_check.extract_number(x[0]))
+            config = json.loads(config)
+            accuracy_check.write_result(results=rows, output_csv_filepath=output_csv or os.path.join(output_folder, "result_subgraphs.csv"), tol=config["tol"], dp=config["dp"])
+    else:
+        for (subgraph_file, config), rows in results.items():
+            config = json.loads(config)
+            accuracy_check.write_result(results=[row for _, row in rows], output_csv_filepath=os.path.join(output_folder, "result_" + subgraph_file.replace(".xml", ".csv")), tol=config["tol"], dp=config["dp"])
+
+    counts = queue.counts()
+    print(f"Collected {counts.get('done', 0)} done, {counts.get('failed', 0)} failed, {counts.get('pending', 0) + counts.get('leased', 0)} unfinished tasks")
+    return counts
+
+
+def group_by_config(results):
+    grouped = {}
+    for (_, config), rows in results.items():
+        grouped.setdefault(config, []).extend(rows)
+    return grouped
+
+
+if __name__ == "__main__":
+    # Examples:
+    # python work_queue.py coordinator --queue sweep.db
+    # python work_queue.py worker --queue sweep.db --processes 4 --device CPU
+    # python work_queue.py status --queue sweep.db
+    # python work_queue.py collect --queue sweep.db
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["coordinator", "worker", "status", "collect"])
+    parser.add_argument("--queue", default=os.getenv('WORK_QUEUE') or "work_queue.db")
+    parser.add_argument("--mode", choices=["for_subgraph", "per_subgraph"], default="for_subgraph")
+    parser.add_argument("--device", help="target device, the coordinator's by default (NPU)")
+    parser.add_argument("--in-memory", action="store_true", help="cut the nodes in memory instead of writing IR files")
+    parser.add_argument("--retry-failed", action="store_true", help="requeue the failed tasks")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--task-timeout", type=float, default=3600)
+    parser.add_argument("--keep-polling", action="store_true", help="wait for new tasks instead of exiting when the queue is drained")
+    parser.add_argument("--output-folder")
+    args = parser.parse_args()
+
+    tol = [0.01,0.001]
+    dp = [4]
+
+    if args.command == "coordinator":
+        queue = WorkQueue(args.queue, args.lease_seconds, args.max_attempts)
+        if args.retry_failed:
+            print(f"Requeued {queue.retry_failed()} failed tasks")
+        coordinate(queue, os.getenv('CPU_SUBGRAPH_FOLDER'), os.getenv('NPU_SUBGRAPH_FOLDER'), args.output_folder or os.getenv('OUTPUT_FOLDER'), tol, dp, args.mode, args.device or "NPU", args.in_memory)
+    elif args.command == "worker":
+        # the subgraph folders may be mounted elsewhere on a worker host
+        run_workers(args.processes, args.queue, subgraph_folder_cpu=os.getenv('CPU_SUBGRAPH_FOLDER'), subgraph_folder_npu=os.getenv('NPU_SUBGRAPH_FOLDER'), target_device=args.device,
+                    lease_seconds=args.lease_seconds, max_attempts=args.max_attempts, task_timeout=args.task_timeout, exit_when_empty=not args.keep_polling, cache_dir=os.getenv('MODEL_CACHE_DIR'))
+    elif args.command == "status":
+        print(WorkQueue(args.queue).counts())
+    else:
+        collect(WorkQueue(args.queue), args.output_folder)